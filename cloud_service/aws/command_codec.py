@@ -0,0 +1,154 @@
+import json
+import struct
+import time
+
+# Robot command encoding shared by the cloud publisher and the Pi subscriber.
+#
+# Two wire formats are supported:
+#   - JSON: {"command": "tracking", "vx": ..., "vy": ..., "omega": ..., "tilt": ..., "seq": ..., "timestamp": ...}
+#     (default, kept for compatibility)
+#   - Binary: fixed 48 byte little-endian layout, see BINARY_FORMAT below.
+#
+# The receiver detects the format from the first byte, so the sender can switch
+# encoding without any change on the Pi. JSON payloads always start with '{'.
+#
+# Commands triggered by a video frame carry its trace: {"producer_timestamp": ..., "frame_index": ...,
+# "capture_time": ...}. producer_timestamp is the AWS_KINESISVIDEO_PRODUCER_TIMESTAMP of the frame's
+# KVS fragment, frame_index the frame's position in that fragment and capture_time the producer
+# time of the frame itself. The Pi is the producer, so capture_time is on the Pi's own clock.
+
+ENCODING_JSON = "json"
+ENCODING_BINARY = "binary"
+
+BINARY_MAGIC = 0xA5
+BINARY_VERSION = 3
+
+# magic, version, command code, gesture code, sequence number, timestamp (s), vx, vy, omega, camera tilt delta (deg),
+# trace: fragment producer timestamp (s, 0 = no trace), frame index, capture time offset from the producer timestamp (s)
+BINARY_FORMAT = struct.Struct("<BBBBIdffffdIf")
+# Version 2 layout (no trace) and version 1 layout (no trace, no camera tilt), still decoded
+BINARY_FORMAT_V2 = struct.Struct("<BBBBIdffff")
+BINARY_FORMAT_V1 = struct.Struct("<BBBBIdfff")
+
+COMMAND_CODES = {
+    "tracking": 1,
+    "gesture": 2,
+    "stop": 3,
+}
+COMMAND_NAMES = {code: name for name, code in COMMAND_CODES.items()}
+
+# Must stay in sync with HandGestureService.gesture_names (plus "Stop").
+GESTURE_CODES = {
+    "Up": 0,
+    "Down": 1,
+    "Left": 2,
+    "Right": 3,
+    "Left Up": 4,
+    "Left Down": 5,
+    "Right Down": 6,
+    "Right Up": 7,
+    "Fire": 8,
+    "Stop": 9,
+}
+GESTURE_NAMES = {code: name for name, code in GESTURE_CODES.items()}
+NO_GESTURE = 0xFF
+
+
+def format_trace_id(trace):
+    """Printable trace ID, "<producer timestamp>/<frame index>", or None without a trace"""
+    if not trace:
+        return None
+    producer_timestamp = trace.get("producer_timestamp")
+    producer = f"{producer_timestamp:.3f}" if isinstance(producer_timestamp, (int, float)) else "?"
+    return f"{producer}/{trace.get('frame_index', '?')}"
+
+
+def can_encode_binary(message):
+    """Return True if the command dict fits in the fixed binary layout"""
+    command = message.get("command")
+    if command not in COMMAND_CODES:
+        return False
+    if command == "gesture" and message.get("gesture") not in GESTURE_CODES:
+        return False
+    return True
+
+
+def encode_command(message, encoding=ENCODING_JSON, seq=0, timestamp=None):
+    """
+    Encode a command dict for publishing, stamped with the sender sequence number and
+    timestamp (seconds since epoch) so the receiver can drop duplicate and stale commands.
+    Falls back to JSON when the binary layout cannot represent the command.
+
+    Returns: str (JSON) or bytes (binary)
+    """
+    if timestamp is None:
+        timestamp = time.time()
+    trace = message.get("trace")
+    if encoding == ENCODING_BINARY and can_encode_binary(message):
+        command = message["command"]
+        gesture_code = GESTURE_CODES[message["gesture"]] if command == "gesture" else NO_GESTURE
+        producer_timestamp = trace["producer_timestamp"] if trace else 0.0
+        return BINARY_FORMAT.pack(
+            BINARY_MAGIC,
+            BINARY_VERSION,
+            COMMAND_CODES[command],
+            gesture_code,
+            seq & 0xFFFFFFFF,
+            timestamp,
+            message.get("vx", 0),
+            message.get("vy", 0),
+            message.get("omega", 0),
+            message.get("tilt", 0),
+            producer_timestamp,
+            trace["frame_index"] & 0xFFFFFFFF if trace else 0,
+            trace["capture_time"] - producer_timestamp if trace else 0.0,
+        )
+    return json.dumps(dict(message, seq=seq & 0xFFFFFFFF, timestamp=timestamp))
+
+
+def is_binary_payload(payload):
+    """Detect the binary format from the first byte of the payload"""
+    return isinstance(payload, (bytes, bytearray, memoryview)) and len(payload) > 0 and payload[0] == BINARY_MAGIC
+
+
+def decode_command(payload):
+    """
+    Decode a command payload (JSON str/bytes or binary bytes) into a dict.
+    Raises ValueError on malformed payloads (json.JSONDecodeError is a ValueError).
+    """
+    if is_binary_payload(payload):
+        version = payload[1] if len(payload) > 1 else None
+        if version == BINARY_VERSION and len(payload) == BINARY_FORMAT.size:
+            (_, _, command_code, gesture_code, seq, timestamp, vx, vy, omega, tilt,
+             producer_timestamp, frame_index, capture_offset) = BINARY_FORMAT.unpack(payload)
+        elif version == 2 and len(payload) == BINARY_FORMAT_V2.size:
+            _, _, command_code, gesture_code, seq, timestamp, vx, vy, omega, tilt = BINARY_FORMAT_V2.unpack(payload)
+            producer_timestamp = 0.0
+        elif version == 1 and len(payload) == BINARY_FORMAT_V1.size:
+            _, _, command_code, gesture_code, seq, timestamp, vx, vy, omega = BINARY_FORMAT_V1.unpack(payload)
+            tilt = 0.0
+            producer_timestamp = 0.0
+        elif version in (1, 2, BINARY_VERSION):
+            raise ValueError(f"Invalid binary command size: {len(payload)}")
+        else:
+            raise ValueError(f"Unsupported binary command version: {version}")
+        command = COMMAND_NAMES.get(command_code, "unknown")
+        data = {"command": command, "seq": seq, "timestamp": timestamp}
+        if producer_timestamp:
+            data["trace"] = {
+                "producer_timestamp": producer_timestamp,
+                "frame_index": frame_index,
+                "capture_time": producer_timestamp + capture_offset,
+            }
+        if command == "gesture":
+            data["gesture"] = GESTURE_NAMES.get(gesture_code, "unknown")
+        else:
+            data["vx"] = vx
+            data["vy"] = vy
+            data["omega"] = omega
+            data["tilt"] = tilt
+        return data
+
+    if isinstance(payload, (bytes, bytearray, memoryview)):
+        payload = bytes(payload).decode()
+    return json.loads(payload)
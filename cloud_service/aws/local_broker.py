@@ -0,0 +1,342 @@
+'''
+Local stand-in for the AWS IoT Core message broker.
+
+Used to run and load-test the cloud controller and the Pi subscriber offline. Select it with
+MQTT_TRANSPORT=local and MQTT_LOCAL_BROKER set to either "inproc" (broker lives in the same
+process) or "host:port" of a broker started with:
+
+    python -m aws.local_broker --port 1884
+
+Connections returned by create_connection() mimic the parts of awscrt.mqtt.Connection used by
+pubsub_aws_iot (connect, disconnect, publish, subscribe, resubscribe_existing_topics), so
+publish()/subscribe() work unchanged. Publish futures of QoS 1 messages complete when the
+broker acknowledges them, QoS 0 futures once the message has been handed over.
+'''
+
+import argparse
+import itertools
+import queue
+import socket
+import socketserver
+import struct
+import threading
+from concurrent.futures import Future
+
+# Frame: 4 byte length, then op, packet id, qos, topic length, topic, payload
+FRAME_LENGTH = struct.Struct("!I")
+FRAME_HEADER = struct.Struct("!BIBH")
+
+OP_SUBSCRIBE = 1
+OP_SUBACK = 2
+OP_PUBLISH = 3
+OP_PUBACK = 4
+
+
+def topic_matches(topic_filter, topic):
+    '''MQTT topic filter matching with + and # wildcards'''
+    filter_levels = topic_filter.split("/")
+    topic_levels = topic.split("/")
+    for i, level in enumerate(filter_levels):
+        if level == "#":
+            return True
+        if i >= len(topic_levels):
+            return False
+        if level != "+" and level != topic_levels[i]:
+            return False
+    return len(filter_levels) == len(topic_levels)
+
+
+def encode_frame(op, packet_id, qos, topic, payload=b""):
+    if isinstance(payload, str):
+        payload = payload.encode()
+    topic_bytes = topic.encode()
+    body = FRAME_HEADER.pack(op, packet_id, int(qos), len(topic_bytes)) + topic_bytes + bytes(payload)
+    return FRAME_LENGTH.pack(len(body)) + body
+
+
+def decode_frame(body):
+    op, packet_id, qos, topic_length = FRAME_HEADER.unpack_from(body)
+    offset = FRAME_HEADER.size
+    topic = body[offset:offset + topic_length].decode()
+    payload = body[offset + topic_length:]
+    return op, packet_id, qos, topic, payload
+
+
+def read_frame(sock_file):
+    header = sock_file.read(FRAME_LENGTH.size)
+    if len(header) < FRAME_LENGTH.size:
+        return None
+    (length,) = FRAME_LENGTH.unpack(header)
+    body = sock_file.read(length)
+    if len(body) < length:
+        return None
+    return decode_frame(body)
+
+
+class LocalBroker:
+    '''
+    Topic router shared by the in-process transport and the TCP server.
+    Subscribers register a deliver(topic, payload, qos) function per topic filter.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = []
+
+    def subscribe(self, topic_filter, deliver):
+        with self._lock:
+            self._subscriptions.append((topic_filter, deliver))
+
+    def unsubscribe_all(self, deliver_owner):
+        with self._lock:
+            self._subscriptions = [
+                (topic_filter, deliver) for topic_filter, deliver in self._subscriptions
+                if getattr(deliver, "__self__", None) is not deliver_owner
+            ]
+
+    def publish(self, topic, payload, qos):
+        with self._lock:
+            targets = [deliver for topic_filter, deliver in self._subscriptions if topic_matches(topic_filter, topic)]
+        for deliver in targets:
+            deliver(topic, payload, qos)
+
+
+_inproc_broker = LocalBroker()
+
+
+class LocalConnectionBase:
+    '''Common awscrt-like connection API; subclasses implement the transport'''
+
+    def __init__(self, client_id):
+        self.client_id = client_id
+        self._packet_ids = itertools.count(1)
+        self._callbacks = []
+        self._callbacks_lock = threading.Lock()
+
+    def _dispatch(self, topic, payload, qos):
+        with self._callbacks_lock:
+            callbacks = [callback for topic_filter, callback in self._callbacks if topic_matches(topic_filter, topic)]
+        for callback in callbacks:
+            try:
+                callback(topic=topic, payload=bytes(payload), dup=False, qos=qos, retain=False)
+            except Exception as e:
+                print(f"[local_broker] Subscriber callback error: {e}")
+
+    def _add_callback(self, topic_filter, callback):
+        with self._callbacks_lock:
+            self._callbacks.append((topic_filter, callback))
+
+    def resubscribe_existing_topics(self):
+        future = Future()
+        with self._callbacks_lock:
+            topics = [(topic_filter, 1) for topic_filter, _ in self._callbacks]
+        future.set_result({"packet_id": next(self._packet_ids), "topics": topics})
+        return future, None
+
+
+class InProcessConnection(LocalConnectionBase):
+    '''Connection to the module-level broker; messages are delivered on a dispatcher thread'''
+
+    def __init__(self, client_id, broker=None):
+        super().__init__(client_id)
+        self.broker = broker or _inproc_broker
+        self._queue = queue.Queue()
+        self._thread = None
+
+    def connect(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._dispatch_loop, name=f"inproc-mqtt-{self.client_id}", daemon=True)
+            self._thread.start()
+        future = Future()
+        future.set_result({"return_code": 0, "session_present": False})
+        return future
+
+    def disconnect(self):
+        self.broker.unsubscribe_all(self)
+        self._queue.put(None)
+        self._thread = None
+        future = Future()
+        future.set_result({})
+        return future
+
+    def _deliver(self, topic, payload, qos):
+        self._queue.put((topic, payload, qos))
+
+    def _dispatch_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            self._dispatch(*item)
+
+    def publish(self, topic, payload, qos, retain=False):
+        packet_id = next(self._packet_ids)
+        future = Future()
+        self.broker.publish(topic, payload.encode() if isinstance(payload, str) else bytes(payload), int(qos))
+        future.set_result({"packet_id": packet_id})
+        return future, packet_id
+
+    def subscribe(self, topic, qos, callback=None):
+        packet_id = next(self._packet_ids)
+        if callback:
+            self._add_callback(topic, callback)
+        self.broker.subscribe(topic, self._deliver)
+        future = Future()
+        future.set_result({"packet_id": packet_id, "topic": topic, "qos": qos})
+        return future, packet_id
+
+
+class TcpConnection(LocalConnectionBase):
+    '''Connection to a LocalBrokerServer over TCP'''
+
+    def __init__(self, client_id, host, port):
+        super().__init__(client_id)
+        self.host = host
+        self.port = port
+        self._sock = None
+        self._send_lock = threading.Lock()
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+
+    def connect(self):
+        future = Future()
+        try:
+            self._sock = socket.create_connection((self.host, self.port))
+            self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            threading.Thread(target=self._read_loop, name=f"local-mqtt-{self.client_id}", daemon=True).start()
+            future.set_result({"return_code": 0, "session_present": False})
+        except OSError as e:
+            future.set_exception(e)
+        return future
+
+    def disconnect(self):
+        future = Future()
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+        future.set_result({})
+        return future
+
+    def _send(self, frame):
+        with self._send_lock:
+            self._sock.sendall(frame)
+
+    def _expect_ack(self, packet_id, result):
+        future = Future()
+        with self._pending_lock:
+            self._pending[packet_id] = (future, result)
+        return future
+
+    def publish(self, topic, payload, qos, retain=False):
+        packet_id = next(self._packet_ids)
+        result = {"packet_id": packet_id}
+        if int(qos) > 0:
+            future = self._expect_ack(packet_id, result)
+            self._send(encode_frame(OP_PUBLISH, packet_id, qos, topic, payload))
+        else:
+            future = Future()
+            self._send(encode_frame(OP_PUBLISH, packet_id, qos, topic, payload))
+            future.set_result(result)
+        return future, packet_id
+
+    def subscribe(self, topic, qos, callback=None):
+        packet_id = next(self._packet_ids)
+        if callback:
+            self._add_callback(topic, callback)
+        future = self._expect_ack(packet_id, {"packet_id": packet_id, "topic": topic, "qos": qos})
+        self._send(encode_frame(OP_SUBSCRIBE, packet_id, qos, topic))
+        return future, packet_id
+
+    def _read_loop(self):
+        sock_file = self._sock.makefile("rb")
+        try:
+            while True:
+                frame = read_frame(sock_file)
+                if frame is None:
+                    break
+                op, packet_id, qos, topic, payload = frame
+                if op == OP_PUBLISH:
+                    self._dispatch(topic, payload, qos)
+                elif op in (OP_PUBACK, OP_SUBACK):
+                    with self._pending_lock:
+                        future, result = self._pending.pop(packet_id, (None, None))
+                    if future is not None:
+                        future.set_result(result)
+        except OSError:
+            pass
+        finally:
+            with self._pending_lock:
+                pending, self._pending = self._pending, {}
+            for future, _ in pending.values():
+                future.set_exception(ConnectionError("Local broker connection closed"))
+
+
+class LocalBrokerServer(socketserver.ThreadingTCPServer):
+    '''Minimal TCP broker for running the cloud controller and Pi in separate processes'''
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host="127.0.0.1", port=1884):
+        self.broker = LocalBroker()
+        super().__init__((host, port), LocalBrokerHandler)
+
+
+class LocalBrokerHandler(socketserver.StreamRequestHandler):
+
+    def setup(self):
+        super().setup()
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._send_lock = threading.Lock()
+
+    def deliver(self, topic, payload, qos):
+        try:
+            with self._send_lock:
+                self.request.sendall(encode_frame(OP_PUBLISH, 0, qos, topic, payload))
+        except OSError:
+            pass
+
+    def handle(self):
+        broker = self.server.broker
+        try:
+            while True:
+                frame = read_frame(self.rfile)
+                if frame is None:
+                    break
+                op, packet_id, qos, topic, payload = frame
+                if op == OP_SUBSCRIBE:
+                    broker.subscribe(topic, self.deliver)
+                    with self._send_lock:
+                        self.request.sendall(encode_frame(OP_SUBACK, packet_id, qos, topic))
+                elif op == OP_PUBLISH:
+                    broker.publish(topic, payload, qos)
+                    if qos > 0:
+                        with self._send_lock:
+                            self.request.sendall(encode_frame(OP_PUBACK, packet_id, qos, topic))
+        except OSError:
+            pass
+        finally:
+            broker.unsubscribe_all(self)
+
+
+def create_connection(client_id, address):
+    '''
+    Create a local connection. address is "inproc" or "host:port".
+    '''
+    if address == "inproc":
+        return InProcessConnection(client_id)
+    host, _, port = address.rpartition(":")
+    return TcpConnection(client_id, host or "127.0.0.1", int(port))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local MQTT broker stand-in for AWS IoT Core")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1884)
+    args = parser.parse_args()
+
+    server = LocalBrokerServer(args.host, args.port)
+    print(f"Local broker listening on {args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -6,6 +6,9 @@ import time
 import json
 from dataclasses import dataclass
 import os
+from .command_codec import is_binary_payload
+from .rolling_stats import RollingWindow, percentile
+from . import local_broker
 
 # This sample uses the Message Broker for AWS IoT to send and receive messages
 # through an MQTT connection. On startup, the device connects to the server,
@@ -69,15 +72,102 @@ class Config:
 
     def __init_once__(self):
         current_dir = os.path.dirname(os.path.abspath(__file__))
-        self.endPoint = "ai6mf8hjrnusz-ats.iot.us-east-1.amazonaws.com"
+        self.endPoint = os.getenv("AWS_IOT_ENDPOINT", "ai6mf8hjrnusz-ats.iot.us-east-1.amazonaws.com")
         self.cert = os.path.join(current_dir, "certs/pi-certificate.pem.crt")
         self.key = os.path.join(current_dir, "certs/pi-private.pem.key")
-        self.ca = os.path.join(current_dir, "certs/AmazonRootCA1.pem")        
+        self.ca = os.path.join(current_dir, "certs/AmazonRootCA1.pem")
 
-def get_connection(client_id_param):
+        # Transport: "aws" (AWS IoT Core over mTLS) or "local" (see local_broker.py).
+        # MQTT_LOCAL_BROKER is "inproc" or "host:port" of a running local broker.
+        self.transport = os.getenv("MQTT_TRANSPORT", "aws")
+        self.local_broker = os.getenv("MQTT_LOCAL_BROKER", "127.0.0.1:1884")
+
+        # Backoff bounds (seconds) for connect retries and awscrt auto-reconnect
+        self.reconnect_min_secs = float(os.getenv("MQTT_RECONNECT_MIN_SECS", 1))
+        self.reconnect_max_secs = float(os.getenv("MQTT_RECONNECT_MAX_SECS", 60))
+
+        # Topics and their QoS. Continuous tracking setpoints go fire-and-forget (QoS 0):
+        # a retransmitted stale velocity is worse than a lost one. Discrete gestures and
+        # stop commands keep QoS 1. Override with MQTT_TOPIC_QOS="topic/a=0,topic/b=1".
+        # Per-robot topics (see robot_fleet) get the QoS of their command kind from the publisher.
+        self.command_topic = os.getenv("MQTT_COMMAND_TOPIC", "topic/robot_command")
+        self.tracking_topic = os.getenv("MQTT_TRACKING_TOPIC", "topic/robot_command/tracking")
+        self.command_qos = mqtt.QoS.AT_LEAST_ONCE
+        self.tracking_qos = mqtt.QoS.AT_MOST_ONCE
+        self.default_qos = mqtt.QoS.AT_LEAST_ONCE
+        self.topic_qos = {
+            self.command_topic: self.command_qos,
+            self.tracking_topic: self.tracking_qos,
+        }
+        for entry in filter(None, os.getenv("MQTT_TOPIC_QOS", "").split(",")):
+            topic, qos = entry.rsplit("=", 1)
+            self.topic_qos[topic.strip()] = mqtt.QoS(int(qos))
+
+    def get_qos(self, topic, default=None):
+        """QoS of topic: MQTT_TOPIC_QOS or the global topics first, then default (or default_qos)"""
+        return self.topic_qos.get(topic, self.default_qos if default is None else default)
+
+
+class PublishMetrics:
+    '''
+    Tracks publish-ack latency per topic. For QoS 1 the publish future completes on PUBACK,
+    for QoS 0 when the packet has been written to the socket.
+    '''
+
+    def __init__(self, window=500):
+        self.window = window
+        self._lock = threading.Lock()
+        self._topics = {}
+
+    def _get_topic(self, topic):
+        stats = self._topics.get(topic)
+        if stats is None:
+            stats = {"published": 0, "acked": 0, "errors": 0, "latencies": RollingWindow(self.window)}
+            self._topics[topic] = stats
+        return stats
+
+    def on_publish(self, topic):
+        with self._lock:
+            self._get_topic(topic)["published"] += 1
+
+    def on_complete(self, topic, latency, error=None):
+        with self._lock:
+            stats = self._get_topic(topic)
+            if error is not None:
+                stats["errors"] += 1
+                return
+            stats["acked"] += 1
+            stats["latencies"].add(latency)
+
+    def snapshot(self):
+        '''
+        Returns a dict per topic with counts and ack latency (ms) over the rolling window.
+        '''
+        result = {}
+        with self._lock:
+            for topic, stats in self._topics.items():
+                latencies = stats["latencies"].sorted()
+                summary = {key: stats[key] for key in ("published", "acked", "errors")}
+                if latencies:
+                    summary["ack_latency_ms"] = {
+                        "p50": percentile(latencies, 0.50) * 1000,
+                        "p95": percentile(latencies, 0.95) * 1000,
+                        "max": latencies[-1] * 1000,
+                    }
+                result[topic] = summary
+        return result
+
+
+publish_metrics = PublishMetrics()
+
+def build_connection(client_id_param):
     config = Config()
 
-    mqtt_connection = mqtt_connection_builder.mtls_from_path(
+    if config.transport == "local":
+        return local_broker.create_connection(client_id_param, config.local_broker)
+
+    # Once connected, awscrt reconnects on its own within these backoff bounds.
+    return mqtt_connection_builder.mtls_from_path(
         endpoint=config.endPoint,
         port=8883,
         cert_filepath=config.cert,
@@ -88,51 +178,168 @@ def get_connection(client_id_param):
         client_id=client_id_param,
         clean_session=False,
         keep_alive_secs=30,
-        http_proxy_options=None,        
+        reconnect_min_timeout_secs=int(config.reconnect_min_secs),
+        reconnect_max_timeout_secs=int(config.reconnect_max_secs),
+        http_proxy_options=None,
         on_connection_success=on_connection_success,
         on_connection_failure=on_connection_failure,
         on_connection_closed=on_connection_closed)
 
-    print("Connecting to endpoint")
-    connect_future = mqtt_connection.connect()
 
-    # Future.result() waits until a result is available
-    connect_future.result()
-    print("Connected!")
-    
-    return mqtt_connection
+class ManagedConnection:
+    '''
+    One shared MQTT connection for a client id. The first connect runs on a background
+    thread and is retried with exponential backoff until it succeeds.
+    '''
+
+    def __init__(self, client_id, min_backoff, max_backoff):
+        self.client_id = client_id
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.connection = None
+        self.connected = threading.Event()
+        self.last_error = None
+        self.started_at = None
+        self.connect_duration = None
+        self._thread = threading.Thread(target=self._connect_loop, name=f"mqtt-connect-{client_id}", daemon=True)
+
+    def start(self):
+        self.started_at = time.monotonic()
+        self._thread.start()
+
+    def _connect_loop(self):
+        backoff = self.min_backoff
+        while True:
+            try:
+                if self.connection is None:
+                    self.connection = build_connection(self.client_id)
+                print(f"Connecting to endpoint as '{self.client_id}'")
+                self.connection.connect().result()
+                print("Connected!")
+                self.connect_duration = time.monotonic() - self.started_at
+                self.connected.set()
+                return
+            except Exception as e:
+                self.last_error = e
+                print(f"Connect failed for '{self.client_id}': {e}. Retrying in {backoff:.1f}s")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+
+
+class ConnectionManager:
+    '''
+    Process-wide MQTT connection manager. Connections are created lazily, shared by
+    client id (AWS IoT drops an older connection when a client id connects twice)
+    and can be warmed up at startup without blocking.
+    '''
+    _instance = None
+    _instance_lock = threading.Lock()
 
-def publish(mqtt_connection, message, message_topic='topic/robot_command'):
-    print("Publishing message to topic '{}': {}".format(message_topic, message))
-    
-    #message_json = json.dumps(message)
-    mqtt_connection.publish(
+    def __new__(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = super(ConnectionManager, cls).__new__(cls)
+                cls._instance.__init_once__()
+        return cls._instance
+
+    def __init_once__(self):
+        self._lock = threading.Lock()
+        self._connections = {}
+
+    def _get_managed(self, client_id):
+        with self._lock:
+            managed = self._connections.get(client_id)
+            if managed is None:
+                config = Config()
+                managed = ManagedConnection(client_id, config.reconnect_min_secs, config.reconnect_max_secs)
+                self._connections[client_id] = managed
+                managed.start()
+            return managed
+
+    def warm_up(self, client_id):
+        '''Start connecting in the background and return immediately'''
+        self._get_managed(client_id)
+
+    def get(self, client_id, timeout=None):
+        '''Return the shared connection for client_id, waiting until it is connected'''
+        managed = self._get_managed(client_id)
+        if not managed.connected.wait(timeout):
+            raise TimeoutError(f"MQTT connection '{client_id}' not ready: {managed.last_error}")
+        return managed.connection
+
+    def is_connected(self, client_id):
+        managed = self._connections.get(client_id)
+        return managed is not None and managed.connected.is_set()
+
+    def connect_duration(self, client_id):
+        '''Seconds from warm_up/get to connected, None while still connecting'''
+        managed = self._connections.get(client_id)
+        return None if managed is None else managed.connect_duration
+
+    def disconnect_all(self):
+        with self._lock:
+            connections = list(self._connections.values())
+            self._connections = {}
+        for managed in connections:
+            if managed.connected.is_set():
+                managed.connection.disconnect().result()
+
+
+def get_connection(client_id_param, timeout=None):
+    return ConnectionManager().get(client_id_param, timeout)
+
+def publish(mqtt_connection, message, message_topic='topic/robot_command', verbose=False, qos=None):
+    if verbose:
+        print("Publishing message to topic '{}': {}".format(message_topic, message))
+
+    if qos is None:
+        qos = Config().get_qos(message_topic)
+
+    publish_time = time.monotonic()
+    publish_metrics.on_publish(message_topic)
+    publish_future, packet_id = mqtt_connection.publish(
         topic=message_topic,
         payload=message,
-        qos=mqtt.QoS.AT_LEAST_ONCE)
+        qos=qos)
 
-# Define the subscribe function to accept a custom callback method
-def subscribe(client_id, callback, message_topic='topic/robot_command'):
-    print("subscribe message topic '{}'".format(message_topic))
+    # Runs on the connection's event-loop thread, never block here.
+    def on_publish_complete(future):
+        latency = time.monotonic() - publish_time
+        publish_metrics.on_complete(message_topic, latency, future.exception())
+
+    publish_future.add_done_callback(on_publish_complete)
+    return publish_future
+
+# Define the subscribe function to accept a custom callback method.
+# message_topic can be a single topic or a list of topics sharing the callback.
+def subscribe(client_id, callback, message_topic='topic/robot_command', verbose=False):
+    config = Config()
+    topics = [message_topic] if isinstance(message_topic, str) else list(message_topic)
 
     mqtt_connection = get_connection(client_id)
 
-    subscribe_future, packet_id = mqtt_connection.subscribe(
-        topic=message_topic,
-        qos=mqtt.QoS.AT_LEAST_ONCE,
-        callback=lambda topic, payload, dup, qos, retain, **kwargs: on_message_received(topic, payload, callback)
-    )
+    for topic in topics:
+        print("subscribe message topic '{}'".format(topic))
+        subscribe_future, packet_id = mqtt_connection.subscribe(
+            topic=topic,
+            qos=config.get_qos(topic),
+            callback=lambda topic, payload, dup, qos, retain, **kwargs: on_message_received(topic, payload, callback, verbose)
+        )
 
-    subscribe_result = subscribe_future.result()
-    print("Subscribed with {}".format(str(subscribe_result['qos'])))
+        subscribe_result = subscribe_future.result()
+        print("Subscribed with {}".format(str(subscribe_result['qos'])))
 
     return mqtt_connection
 
 # Callback when the subscribed topic receives a message
-def on_message_received(topic, payload, callback):
-    print(f"Received message from topic '{topic}': {payload.decode()}")
-    
+def on_message_received(topic, payload, callback, verbose=False):
+    # Binary commands (see command_codec) are passed through as bytes, everything else as str
+    if not is_binary_payload(payload):
+        payload = payload.decode()
+    if verbose:
+        print(f"Received message from topic '{topic}': {payload}")
+
     # Execute the callback function passed as a parameter
     if callback:
-        callback(payload.decode())
+        callback(payload)
 
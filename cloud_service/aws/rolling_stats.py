@@ -0,0 +1,27 @@
+from collections import deque
+
+
+def percentile(sorted_samples, p):
+    """Nearest-rank p (0..1) percentile of an already sorted, non-empty sequence"""
+    return sorted_samples[min(len(sorted_samples) - 1, int(len(sorted_samples) * p))]
+
+
+class RollingWindow:
+    """
+    The last `window` samples, oldest dropped first. Not locked: owners that record from
+    several threads hold their own lock around add() and sorted().
+    Shared by the cloud stage timings, the MQTT publish metrics and the Pi latency recorders.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self._samples = deque(maxlen=window)
+
+    def add(self, value):
+        self._samples.append(value)
+
+    def sorted(self):
+        return sorted(self._samples)
+
+    def __len__(self):
+        return len(self._samples)
@@ -0,0 +1,178 @@
+'''
+End-to-end benchmark of the cloud pipeline on recorded MKV fragments:
+
+    FakeKvsMediaClient -> KvsConsumerLibrary -> KvsFragementProcessor -> ObjectTrackingRobotController
+    -> InferenceEngine -> CommandPublisher (in-process MQTT broker unless --mqtt aws)
+
+Prints one JSON document with throughput (fragments/s, frames/s), p50/p95/p99 per stage and peak RSS,
+and writes it to --output, so runs can be compared across commits. Engine settings come from the
+usual env vars (INFERENCE_WORKERS, INFERENCE_BATCH_SIZE, ...).
+
+    python benchmark.py --media recordings/ --robots 2 --speed 0 --output bench.json
+'''
+
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import platform
+import subprocess
+import threading
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the KVS -> inference -> command pipeline offline")
+    parser.add_argument("--media", required=True,
+                        help="Directory of recorded MKV fragments (<dir>/<stream>/*.mkv or <dir>/*.mkv)")
+    parser.add_argument("--robots", type=int, default=1, help="Number of robots (streams) fed in parallel")
+    parser.add_argument("--stream", default="bench-stream",
+                        help="Stream name prefix, robot i reads <media>/<stream>-<i> if it exists")
+    parser.add_argument("--speed", type=float, default=0,
+                        help="Playback speed: 1 = real time, N = N times real time, 0 = as fast as possible")
+    parser.add_argument("--loops", type=int, default=1, help="Times the recorded fragments are replayed")
+    parser.add_argument("--chunk-size", type=int, default=1024, help="GetMedia payload chunk size (bytes)")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="Random delay of up to this per chunk (ms)")
+    parser.add_argument("--fragment-duration", type=float, default=2.0,
+                        help="Duration of one recorded fragment (s), paces --speed")
+    parser.add_argument("--one-in-frames", type=int, default=5, help="Process one in this many decoded frames")
+    parser.add_argument("--mqtt", choices=["inproc", "aws"], default="inproc",
+                        help="Publish commands to the in-process broker or to AWS IoT Core")
+    parser.add_argument("--drain-timeout", type=float, default=30,
+                        help="Seconds to wait for frames still in inference after the last fragment")
+    parser.add_argument("--output", help="Also write the JSON result to this file")
+    return parser.parse_args()
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def peak_rss_mb():
+    '''Peak resident set size of this process and of its (inference worker) children, ru_maxrss is KiB on Linux'''
+    scale = 1 / (1024 * 1024) if sys.platform == "darwin" else 1 / 1024
+    return {
+        "self": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale, 1),
+        "children": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale, 1),
+    }
+
+
+def run(args):
+    if args.mqtt == "inproc":
+        os.environ["MQTT_TRANSPORT"] = "local"
+        os.environ["MQTT_LOCAL_BROKER"] = "inproc"
+
+    # Imported here so the MQTT settings above are in place before the models and connections start
+    from src.fake_kvs_media import FakeKvsMediaClient
+    from src.inference_engine import InferenceEngine
+    from src.kinesis_video_fragment_processor import KvsFragementProcessor
+    from src.kinesis_video_streams_parser import KvsConsumerLibrary
+    from src.robot_controller import ObjectTrackingRobotController
+    from src.stage_timing import stage_timings
+
+    startup_start = time.monotonic()
+    engine = InferenceEngine(num_streams=args.robots)
+    processors = {}
+    for i in range(args.robots):
+        name = f"robot{i + 1}"
+        controller = ObjectTrackingRobotController(name=name, engine=engine, client_id=f"bench_{name}",
+                                                   command_topic=f"{name}/command",
+                                                   tracking_topic=f"{name}/command/tracking")
+        processors[f"{args.stream}-{i + 1}"] = KvsFragementProcessor(controller)
+    startup_time = time.monotonic() - startup_start
+
+    media_client = FakeKvsMediaClient(args.media, chunk_size=args.chunk_size, jitter=args.jitter_ms / 1000.0,
+                                      speed=args.speed, fragment_duration=args.fragment_duration)
+    lock = threading.Lock()
+    fragment_count = [0]
+    errors = []
+
+    def on_fragment_arrived(stream_name, fragment_bytes, fragment_dom, fragment_receive_duration):
+        stage_timings.record("fragment_receive", fragment_receive_duration)
+        with stage_timings.time("fragment"):
+            processors[stream_name].process_frame_to_robot(fragment_bytes, args.one_in_frames)
+        with lock:
+            fragment_count[0] += 1
+
+    def on_stream_read_complete(stream_name):
+        pass
+
+    def on_stream_read_exception(stream_name, error):
+        errors.append(f"{stream_name}: {error}")
+
+    # Model warm-up and startup are not part of the measurement
+    stage_timings.reset()
+    start = time.monotonic()
+    for _ in range(args.loops):
+        consumers = []
+        for stream_name in processors:
+            consumer = KvsConsumerLibrary(stream_name, media_client.get_media(StreamName=stream_name),
+                                          on_fragment_arrived, on_stream_read_complete, on_stream_read_exception)
+            consumer.start()
+            consumers.append(consumer)
+        for consumer in consumers:
+            consumer.join()
+    ingest_time = time.monotonic() - start
+
+    # Wait until every submitted frame has been applied
+    controllers = [processor.robot_controller for processor in processors.values()]
+    deadline = time.monotonic() + args.drain_timeout
+    while any(c.frames_in_flight() for c in controllers) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    elapsed = time.monotonic() - start
+    frames_left = sum(c.frames_in_flight() for c in controllers)
+    if frames_left:
+        errors.append(f"{frames_left} frames still in inference "
+                      f"after the {args.drain_timeout}s drain timeout")
+
+    frames = stage_timings.count("frame")
+
+    # Children only count towards RUSAGE_CHILDREN once they have exited
+    if engine.inference_pool is not None:
+        engine.inference_pool.shutdown()
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "host": {"machine": platform.machine(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "config": {
+            "robots": args.robots,
+            "speed": args.speed,
+            "loops": args.loops,
+            "chunk_size": args.chunk_size,
+            "jitter_ms": args.jitter_ms,
+            "one_in_frames": args.one_in_frames,
+            "mqtt": args.mqtt,
+            "inference_workers": engine.num_workers,
+            "inference_batch_size": engine.batch_size,
+        },
+        "startup_s": round(startup_time, 3),
+        "elapsed_s": round(elapsed, 3),
+        "ingest_s": round(ingest_time, 3),
+        "fragments": fragment_count[0],
+        "frames": frames,
+        "fragments_per_s": round(fragment_count[0] / elapsed, 3) if elapsed > 0 else 0,
+        "frames_per_s": round(frames / elapsed, 3) if elapsed > 0 else 0,
+        "commands_sent": sum(c.command_publisher.sent_count for c in controllers),
+        "commands_coalesced": sum(c.command_publisher.coalesced_count for c in controllers),
+        "stages": stage_timings.summary(),
+        "peak_rss_mb": peak_rss_mb(),
+        "errors": errors,
+    }
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    result = run(args)
+    output = json.dumps(result, indent=2)
+    print(output, flush=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    # Publisher and MQTT threads are daemons waiting on their queues
+    os._exit(0 if not result["errors"] else 1)
@@ -13,14 +13,16 @@ __author__ = "Dean Colcott <https://www.linkedin.com/in/deancolcott/>"
 import os
 import sys
 import time
+import threading
 import boto3
 import requests
 import logging
 from src.kinesis_video_streams_parser import KvsConsumerLibrary
 from src.kinesis_video_fragment_processor import KvsFragementProcessor
+from src.robot_fleet import RobotFleet, load_robot_configs, ROBOTS_CONFIG
+from src.fake_kvs_media import FakeKvsMediaClient, KVS_FAKE_MEDIA_DIR
+from src.stage_timing import stage_timings
 import subprocess
-from ultralytics import YOLO
-import cv2
 
 
 # Config the logger.
@@ -29,9 +31,18 @@ logging.basicConfig(format="[%(name)s.%(funcName)s():%(lineno)d] - [%(levelname)
                     stream=sys.stdout, 
                     level=logging.INFO)
 
-# Update the desired region and KVS stream name.
+# Update the desired region. Streams and robots are listed in ROBOTS_CONFIG (see robot_fleet.py),
+# the STREAM env var is the single stream used when that file does not exist.
 REGION = os.environ.get('AWS_REGION', 'us-east-1')
-KVS_STREAM01_NAME = os.environ.get('STREAM', 'pi-stream-object-detection')
+
+# GetDataEndpoint results and the media clients built on them are reused for this long (seconds).
+KVS_ENDPOINT_TTL = float(os.environ.get('KVS_ENDPOINT_TTL', 3000))
+# Reconnect backoff bounds (seconds) after a GetMedia failure or a stream read error.
+KVS_RECONNECT_MIN_SECS = float(os.environ.get('KVS_RECONNECT_MIN_SECS', 0.5))
+KVS_RECONNECT_MAX_SECS = float(os.environ.get('KVS_RECONNECT_MAX_SECS', 30))
+# Resume after the last good fragment (continuation token) only if it arrived this recently (seconds),
+# older media is of no use to steer a robot so the stream restarts from NOW.
+KVS_RESUME_MAX_AGE = float(os.environ.get('KVS_RESUME_MAX_AGE', 10))
 
 class KvsPythonConsumerExample:
     '''
@@ -48,11 +59,21 @@ class KvsPythonConsumerExample:
         into MKV fragments and provides convenience functions to further process, save and extract individual frames.  
         '''
 
-        # Create shared instance of KvsFragementProcessor
-        self.kvs_fragment_processor = KvsFragementProcessor()
+        # One controller per robot on shared models, and one KvsFragementProcessor per stream
+        self.robot_fleet = RobotFleet(load_robot_configs(ROBOTS_CONFIG))
+        self.kvs_fragment_processors = {
+            stream_name: KvsFragementProcessor(self.robot_fleet.controllers[robot_name])
+            for robot_name, stream_name in self.robot_fleet.streams()
+        }
+
+        # Variable to maintaun state of last good fragememt per stream mostly for error and exception handling.
+        self.last_good_fragment_tags = {}
+        self.last_good_fragment_time = {}
+        self.stream_read_errors = {}
 
-        # Variable to maintaun state of last good fragememt mostly for error and exception handling.
-        self.last_good_fragment_tags = None
+        # Cached (endpoint, media client, expiry time) per (stream, API name), see _get_media_client
+        self._media_clients = {}
+        self._media_clients_lock = threading.Lock()
 
         # Init the KVS Service Client and get the accounts KVS service endpoint
         log.info('Initializing Amazon Kinesis Video client....')
@@ -65,38 +86,95 @@ class KvsPythonConsumerExample:
     def service_loop(self):
         
         ####################################################
-        # Start an instance of the KvsConsumerLibrary reading in a Kinesis Video Stream
+        # Read every Kinesis Video Stream on its own thread, each reconnecting independently
+
+        stream_threads = [
+            threading.Thread(target=self.stream_loop, args=(stream_name,), name=f"kvs-{stream_name}", daemon=True)
+            for stream_name in self.kvs_fragment_processors
+        ]
+        for stream_thread in stream_threads:
+            stream_thread.start()
+        print("joining stream readers...")
+        for stream_thread in stream_threads:
+            stream_thread.join()
+
+    def stream_loop(self, stream_name):
+        '''
+        Keeps a KvsConsumerLibrary reading stream_name. When GetMedia fails or the read ends, the stream is
+        requested again after the last good fragment, waiting with exponential backoff between failed attempts.
+        Recorded media (KVS_FAKE_MEDIA_DIR) is read once: the loop ends when the replay completes, as the fake
+        client replays from the first fragment on every request (set KVS_FAKE_LOOP=1 to replay forever).
+        '''
+        backoff = KVS_RECONNECT_MIN_SECS
+        while True:
+            last_fragment_time = self.last_good_fragment_time.get(stream_name)
+            try:
+                self.stream_read_errors.pop(stream_name, None)
+                stream_consumer = self.start_stream_consumer(stream_name)
+                stream_consumer.join()
+                failed = stream_name in self.stream_read_errors
+            except Exception as err:
+                log.error(f'GetMedia failed for stream: {stream_name}: {err}')
+                failed = True
+
+            if failed:
+                # The endpoint may have moved, look it up again on the next attempt
+                self._invalidate_media_client(stream_name, 'GET_MEDIA')
+            elif KVS_FAKE_MEDIA_DIR:
+                log.info(f'Recorded media replay complete for stream: {stream_name}')
+                return
+
+            # Fragments arrived since the last attempt: the connection worked, reconnect right away
+            if self.last_good_fragment_time.get(stream_name) != last_fragment_time:
+                backoff = KVS_RECONNECT_MIN_SECS
+                if not failed:
+                    continue
+
+            log.info(f'Reconnecting to stream: {stream_name} in {backoff:.1f}s')
+            time.sleep(backoff)
+            backoff = min(backoff * 2, KVS_RECONNECT_MAX_SECS)
+
+    def _get_start_selector(self, stream_name):
+        '''
+        Resume after the last good fragment with its continuation token when it is recent enough, otherwise start at NOW.
+        '''
+        tags = self.last_good_fragment_tags.get(stream_name) or {}
+        continuation_token = tags.get('AWS_KINESISVIDEO_CONTINUATION_TOKEN')
+        last_fragment_time = self.last_good_fragment_time.get(stream_name)
+        if continuation_token and last_fragment_time and time.monotonic() - last_fragment_time <= KVS_RESUME_MAX_AGE:
+            return {
+                'StartSelectorType': 'CONTINUATION_TOKEN',
+                'ContinuationToken': continuation_token,
+            }
+        return {
+            'StartSelectorType': 'NOW'
+        }
 
-        # Get the KVS Endpoint for the GetMedia Call for this stream
-        log.info(f'Getting KVS GetMedia Endpoint for stream: {KVS_STREAM01_NAME} ........') 
-        get_media_endpoint = self._get_data_endpoint(KVS_STREAM01_NAME, 'GET_MEDIA')
-        
-        # Get the KVS Media client for the GetMedia API call
-        log.info(f'Initializing KVS Media client for stream: {KVS_STREAM01_NAME}........') 
-        kvs_media_client = self.session.client('kinesis-video-media', endpoint_url=get_media_endpoint)
+    def start_stream_consumer(self, stream_name):
+
+        # Get the (cached) KVS Media client for the GetMedia API call of this stream
+        kvs_media_client = self._get_media_client(stream_name, 'GET_MEDIA')
 
         # Make a KVS GetMedia API call with the desired KVS stream and StartSelector type and time bounding.
-        log.info(f'Requesting KVS GetMedia Response for stream: {KVS_STREAM01_NAME}........') 
+        start_selector = self._get_start_selector(stream_name)
+        log.info(f'Requesting KVS GetMedia Response for stream: {stream_name} from {start_selector["StartSelectorType"]}........') 
         get_media_response = kvs_media_client.get_media(
-            StreamName=KVS_STREAM01_NAME,
-            StartSelector={
-                'StartSelectorType': 'NOW'
-            }
+            StreamName=stream_name,
+            StartSelector=start_selector
         )
         
         # Initialize an instance of the KvsConsumerLibrary, provide the GetMedia response and the required call-backs
-        log.info(f'Starting KvsConsumerLibrary for stream: {KVS_STREAM01_NAME}........') 
-        my_stream01_consumer = KvsConsumerLibrary(KVS_STREAM01_NAME, 
-                                                    get_media_response, 
-                                                    self.on_fragment_arrived, 
-                                                    self.on_stream_read_complete, 
-                                                    self.on_stream_read_exception
-                                                    )
-
-        print("starting consumer")
-        my_stream01_consumer.start()
-        print("joining consumer...")
-        my_stream01_consumer.join()
+        log.info(f'Starting KvsConsumerLibrary for stream: {stream_name}........') 
+        stream_consumer = KvsConsumerLibrary(stream_name, 
+                                             get_media_response, 
+                                             self.on_fragment_arrived, 
+                                             self.on_stream_read_complete, 
+                                             self.on_stream_read_exception
+                                             )
+
+        print(f"starting consumer for {stream_name}")
+        stream_consumer.start()
+        return stream_consumer
             
 
     ####################################################
@@ -104,10 +182,20 @@ class KvsPythonConsumerExample:
 
     def on_fragment_arrived(self, stream_name, fragment_bytes, fragment_dom, fragment_receive_duration):
         try:
-            self.last_good_fragment_tags = self.kvs_fragment_processor.get_fragment_tags(fragment_dom)
+            kvs_fragment_processor = self.kvs_fragment_processors[stream_name]
+            fragment_tags = kvs_fragment_processor.get_fragment_tags(fragment_dom)
+            self.last_good_fragment_tags[stream_name] = fragment_tags
+            self.last_good_fragment_time[stream_name] = time.monotonic()
+
+            # Time from the first chunk to the complete fragment, as measured by the KvsConsumerLibrary
+            stage_timings.record("fragment_receive", fragment_receive_duration)
 
             one_in_frames_ratio = 5
-            self.kvs_fragment_processor.process_frame_to_robot(fragment_bytes, one_in_frames_ratio)
+            with stage_timings.time("fragment"):
+                kvs_fragment_processor.process_frame_to_robot(
+                    fragment_bytes, one_in_frames_ratio,
+                    producer_timestamp=kvs_fragment_processor.get_producer_timestamp(fragment_tags)
+                )
 
         except Exception as err:
             log.error(f'on_fragment_arrived Error: {err}')
@@ -134,16 +222,14 @@ class KvsPythonConsumerExample:
         '''
 
         # Do something here to tell the application that reading from the stream ended gracefully.
-        print(f'Read Media on stream: {stream_name} Completed successfully - Last Fragment Tags: {self.last_good_fragment_tags}')
+        print(f'Read Media on stream: {stream_name} Completed successfully - Last Fragment Tags: {self.last_good_fragment_tags.get(stream_name)}')
 
     def on_stream_read_exception(self, stream_name, error):
         '''
         This callback is triggered by an exception in the KvsConsumerLibrary reading a stream. 
         
-        For example, to process use the last good fragment number from self.last_good_fragment_tags to
-        restart the stream from that point in time with the example stream selector provided below. 
-        
-        Alternatively, just handle the failed stream as per your application logic requirements.
+        The error is flagged for stream_loop, which restarts the stream after the last good fragment
+        in self.last_good_fragment_tags (its continuation token) once the reconnect backoff has passed.
 
         ### Parameters:
 
@@ -156,14 +242,10 @@ class KvsPythonConsumerExample:
 
         '''
 
-        # Can choose to restart the KvsConsumerLibrary thread at the last received fragment with below example StartSelector
-        #StartSelector={
-        #    'StartSelectorType': 'FRAGMENT_NUMBER',
-        #    'AfterFragmentNumber': self.last_good_fragment_tags['AWS_KINESISVIDEO_CONTINUATION_TOKEN'],
-        #}
-
-        # Here we just log the error 
-        print(f'####### ERROR: Exception on read stream: {stream_name}\n####### Fragment Tags:\n{self.last_good_fragment_tags}\nError Message:{error}')
+        # stream_loop restarts the KvsConsumerLibrary thread after the last received fragment
+        # (see _get_start_selector), here we just flag and log the error
+        self.stream_read_errors[stream_name] = error
+        print(f'####### ERROR: Exception on read stream: {stream_name}\n####### Fragment Tags:\n{self.last_good_fragment_tags.get(stream_name)}\nError Message:{error}')
 
     ####################################################
     # KVS Helpers
@@ -177,6 +259,34 @@ class KvsPythonConsumerExample:
         )
         return response['DataEndpoint']
 
+    def _get_media_client(self, stream_name, api_name):
+        '''
+        KVS Media client on the data endpoint of stream_name / api_name. Endpoint and client are cached for
+        KVS_ENDPOINT_TTL seconds so reconnects don't cost a GetDataEndpoint call and a new client each time.
+        '''
+        # Offline load testing: replay recorded fragments instead of reading the stream
+        if KVS_FAKE_MEDIA_DIR:
+            return FakeKvsMediaClient(KVS_FAKE_MEDIA_DIR)
+
+        key = (stream_name, api_name)
+        with self._media_clients_lock:
+            cached = self._media_clients.get(key)
+            if cached and cached[2] > time.monotonic():
+                return cached[1]
+
+        log.info(f'Getting KVS {api_name} Endpoint for stream: {stream_name} ........') 
+        endpoint = self._get_data_endpoint(stream_name, api_name)
+        log.info(f'Initializing KVS Media client for stream: {stream_name}........') 
+        # Creating clients from a shared boto3 Session is not thread-safe, the stream threads take turns
+        with self._media_clients_lock:
+            media_client = self.session.client('kinesis-video-media', endpoint_url=endpoint)
+            self._media_clients[key] = (endpoint, media_client, time.monotonic() + KVS_ENDPOINT_TTL)
+        return media_client
+
+    def _invalidate_media_client(self, stream_name, api_name):
+        with self._media_clients_lock:
+            self._media_clients.pop((stream_name, api_name), None)
+
 if __name__ == "__main__":
     '''
     Main method for example KvsConsumerLibrary
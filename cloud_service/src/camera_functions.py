@@ -1,33 +1,41 @@
 import os
 import cv2
-from ultralytics import YOLO
-from deep_sort_realtime.deepsort_tracker import DeepSort
-from typing import Tuple, List, Optional
+import numpy as np
+from typing import Tuple, List, Optional, TYPE_CHECKING
 
+if TYPE_CHECKING:
+    from ultralytics import YOLO
+    from deep_sort_realtime.deepsort_tracker import DeepSort
 
-def yolo_ds_model_initialize(
-    model_name: Optional[str] = None,
+
+def yolo_model_initialize(model_name: Optional[str] = None) -> "YOLO":
+    """
+    Load the YOLO model (YOLO_MODEL_PATH env var fallback).
+    """
+    model_name = model_name or os.getenv("YOLO_MODEL_PATH", "models/yolo11n.pt")
+
+    # Validate paths exist
+    if not os.path.exists(model_name):
+        raise FileNotFoundError(f"Model file not found: {model_name}")
+
+    # Deferred import: torch/ultralytics take seconds to import and only matter once models load
+    from ultralytics import YOLO
+
+    return YOLO(model_name)
+
+def deepsort_initialize(
     nms_max_overlap: Optional[float] = None,
     max_iou_distance: Optional[float] = None,
     max_age: Optional[int] = None,
     n_init: Optional[int] = None,
-    nn_budget: Optional[int] = None
-) -> Tuple[YOLO, List[str], DeepSort]:
+    nn_budget: Optional[int] = None,
+    embedder=None
+) -> "DeepSort":
     """
-    Initialize YOLO model and DeepSort tracker with env var fallback.
-    
-    Args:
-        All parameters support env var overrides (see .env.example).
-        Defaults are used if neither arg nor env var is provided.
-    
-    Returns:
-        model: Loaded YOLO model
-        class_names: List of class names
-        tracker: Configured DeepSort tracker
+    Create the DeepSort tracker with env var fallback (see yolo_ds_model_initialize).
+    embedder: appearance model of another tracker (tracker.embedder) to share instead of loading one.
     """
-    # Load from environment variables if args are None
     config = {
-        "model_name": model_name or os.getenv("YOLO_MODEL_PATH", "models/yolo11n.pt"),
         "nms_max_overlap": float(nms_max_overlap or os.getenv("DEEPSORT_NMS_OVERLAP", 0.6)),
         "max_iou_distance": float(max_iou_distance or os.getenv("DEEPSORT_MAX_IOU_DISTANCE", 0.7)),
         "max_age": int(max_age or os.getenv("DEEPSORT_MAX_AGE", 35)),
@@ -35,41 +43,71 @@ def yolo_ds_model_initialize(
         "nn_budget": int(nn_budget or os.getenv("DEEPSORT_NN_BUDGET", 200))
     }
 
-    # Validate paths exist
-    if not os.path.exists(config["model_name"]):
-        raise FileNotFoundError(f"Model file not found: {config['model_name']}")
+    from deep_sort_realtime.deepsort_tracker import DeepSort
 
-    # Initialize models
-    model = YOLO(config["model_name"])
     tracker = DeepSort(
         max_age=config["max_age"],
         n_init=config["n_init"],
         nn_budget=config["nn_budget"],
         nms_max_overlap=config["nms_max_overlap"],
-        max_iou_distance=config["max_iou_distance"]
+        max_iou_distance=config["max_iou_distance"],
+        embedder=None if embedder is not None else "mobilenet"
     )
-    
-    return model, model.names, tracker
+    if embedder is not None:
+        tracker.embedder = embedder
+    return tracker
 
-def yolo_results(model, frame):
+def yolo_ds_model_initialize(
+    model_name: Optional[str] = None,
+    nms_max_overlap: Optional[float] = None,
+    max_iou_distance: Optional[float] = None,
+    max_age: Optional[int] = None,
+    n_init: Optional[int] = None,
+    nn_budget: Optional[int] = None
+) -> Tuple["YOLO", List[str], "DeepSort"]:
     """
-    Perform object detection using the YOLO model.
+    Initialize YOLO model and DeepSort tracker with env var fallback.
+    
     Args:
-        model (YOLO): The loaded YOLO model.
-        frame (numpy.ndarray): The input frame.
+        All parameters support env var overrides (see .env.example).
+        Defaults are used if neither arg nor env var is provided.
+    
     Returns:
-        results (list): The detection results.
-        detections (list): The detected bounding boxes, confidences, and class IDs.
-    """
-    # Perform object detection
-    results = model.track(frame, conf=0.7, persist=True, verbose=False)
-    detections = []
-    for box in results[0].boxes:
-        x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-        conf = float(box.conf[0])
-        cls = int(box.cls[0])
-        detections.append(([x1, y1, x2 - x1, y2 - y1], conf, cls))
-    return results, detections
+        model: Loaded YOLO model
+        class_names: List of class names
+        tracker: Configured DeepSort tracker
+    """
+    model = yolo_model_initialize(model_name)
+    tracker = deepsort_initialize(nms_max_overlap, max_iou_distance, max_age, n_init, nn_budget)
+    
+    return model, model.names, tracker
+
+def yolo_warm_up(model, width=640, height=480):
+    """
+    Run one dummy inference so weight fusing and backend setup happen at startup,
+    not on the first streamed frame. Uses predict() to leave the tracker state untouched.
+    """
+    model.predict(np.zeros((height, width, 3), dtype=np.uint8), verbose=False)
+
+def yolo_detect_batch(model, frames):
+    """
+    YOLO detection for frames of any stream. Stateless: with a model shared by several
+    robots or inference workers, YOLO's own tracker (model.track) would mix streams. DeepSort
+    assigns the IDs. All frames go through the model as one batch.
+    Returns one detection list per frame: ([x, y, w, h], confidence, class id) per box.
+    """
+    results = model.predict(list(frames), conf=0.7, verbose=False)
+    batch_detections = []
+    for result in results:
+        detections = []
+        for box in result.boxes:
+            x1, y1, x2, y2 = (float(v) for v in box.xyxy[0].cpu().numpy())
+            detections.append(([x1, y1, x2 - x1, y2 - y1], float(box.conf[0]), int(box.cls[0])))
+        batch_detections.append(detections)
+    return batch_detections
+
+def yolo_detect(model, frame):
+    return yolo_detect_batch(model, [frame])[0]
 
 def yolo_ds_update(frame, detections, tracker):
     """
@@ -85,18 +123,19 @@ def yolo_ds_update(frame, detections, tracker):
     last_detections = tracker.update_tracks(detections, frame=frame)
     return last_detections
 
-def yolo_ds_draw(frame, last_detections, class_names):
+def yolo_ds_draw(frame, last_detections, class_names, copy=True):
     """
     Draw the detection results on the frame.
     Args:
         frame (numpy.ndarray): The input frame.
         last_detections (list): The updated detections.
         class_names (list): The class names of the model.
+        copy (bool): Draw on a copy. False draws in place, once nothing else reads the raw frame.
     Returns:
         annotated_frame (numpy.ndarray): The annotated frame.
         objects_centers (list): List of detected objects with their ID, class, and bounding box.
     """
-    annotated = frame.copy()
+    annotated = frame.copy() if copy else frame
     objects_centers = []
     ltrb = None
 
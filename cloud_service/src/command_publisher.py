@@ -0,0 +1,169 @@
+import os
+import threading
+from collections import deque
+import time
+
+from aws.pubsub_aws_iot import publish, Config, ConnectionManager
+from aws.command_codec import encode_command
+from src.stage_timing import stage_timings
+
+
+class CommandPublisher:
+    """
+    Publishes robot commands to MQTT from a dedicated background thread.
+
+    The inference loop hands commands over with submit() and never waits on MQTT.
+    Pending commands live in a single latest-value-wins slot: a new command replaces
+    any command that has not been sent yet. Sending is capped at max_rate_hz and a
+    command identical to the last one sent is suppressed unless repeat_interval
+    seconds have passed since it went out.
+
+    Commands are encoded on this thread as JSON or, with encoding="binary"
+    (COMMAND_ENCODING env var), in the compact layout from aws.command_codec.
+
+    Tracking setpoints go to tracking_topic (QoS 0 by default), every other command
+    to command_topic (QoS 1), see Config.topic_qos.
+
+    A command's frame "trace" is sent along but ignored by the duplicate check, the
+    same command from a newer frame is still a duplicate.
+
+    Without an explicit connection, the shared connection for client_id is taken from
+    the ConnectionManager on first send, so any connect wait happens on this thread.
+    """
+
+    def __init__(self, connection=None, client_id="pi_sender", command_topic=None, tracking_topic=None,
+                 max_rate_hz=None, repeat_interval=None, encoding=None):
+        config = Config()
+        self.connection = connection
+        self.client_id = client_id
+        self.command_topic = command_topic or config.command_topic
+        self.tracking_topic = tracking_topic or config.tracking_topic
+        self.encoding = encoding or os.getenv("COMMAND_ENCODING", "json")
+        self.max_rate_hz = float(max_rate_hz or os.getenv("COMMAND_MAX_RATE_HZ", 10))
+        self.repeat_interval = float(repeat_interval or os.getenv("COMMAND_REPEAT_INTERVAL", 0.5))
+        self.min_interval = 1.0 / self.max_rate_hz if self.max_rate_hz > 0 else 0.0
+
+        self._condition = threading.Condition()
+        self._pending = None
+        self._pending_dedupe = True
+        self._queue = deque()
+        self._running = False
+        self._thread = None
+
+        self._last_sent = None
+        self._last_sent_time = 0.0
+        self._seq = 0
+
+        # Counters for monitoring
+        self.sent_count = 0
+        self.coalesced_count = 0
+        self.duplicate_count = 0
+        self.error_count = 0
+
+    def start(self):
+        """Start the publisher thread"""
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name="command-publisher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=1.0):
+        """Stop the publisher thread, dropping any unsent command"""
+        with self._condition:
+            self._running = False
+            self._pending = None
+            self._queue.clear()
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def submit(self, message, coalesce=True, dedupe=True):
+        """
+        Queue a command (dict) for publishing. Never blocks on the network.
+        Replaces the pending command if the previous one has not been sent yet.
+        With coalesce=False the command is queued instead and always sent, ahead of
+        the pending one and without rate limiting (for one-off commands such as a
+        target selection).
+        With dedupe=False the command skips the duplicate check, for commands whose
+        repeats the caller already paces (held gestures, see GestureFilter).
+        """
+        with self._condition:
+            if not coalesce:
+                self._queue.append(message)
+            else:
+                if self._pending is not None:
+                    self.coalesced_count += 1
+                self._pending = message
+                self._pending_dedupe = dedupe
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._running and self._pending is None and not self._queue:
+                    self._condition.wait()
+                if not self._running:
+                    return
+
+                # One-off commands go out first, without rate limiting or duplicate checks
+                if self._queue:
+                    queued = self._queue.popleft()
+                else:
+                    queued = None
+
+                    # Respect the max command rate. Waiting on the condition lets newer
+                    # commands replace the pending one while we hold off.
+                    wait_time = self._last_sent_time + self.min_interval - time.monotonic()
+                    if wait_time > 0:
+                        self._condition.wait(wait_time)
+                        continue
+
+                    message = self._pending
+                    dedupe = self._pending_dedupe
+                    self._pending = None
+
+            if queued is not None:
+                self._send(queued)
+                continue
+
+            now = time.monotonic()
+            command = self._without_trace(message)
+            if dedupe and command == self._last_sent and now - self._last_sent_time < self.repeat_interval:
+                self.duplicate_count += 1
+                continue
+
+            self._send(message)
+            self._last_sent = command
+            self._last_sent_time = now
+
+    @staticmethod
+    def _without_trace(message):
+        if "trace" not in message:
+            return message
+        return {key: value for key, value in message.items() if key != "trace"}
+
+    def _send(self, message):
+        self._seq += 1
+        try:
+            if self.connection is None:
+                self.connection = ConnectionManager().get(self.client_id)
+            with stage_timings.time("command_encoding"):
+                payload = encode_command(message, self.encoding, seq=self._seq)
+            config = Config()
+            if message.get("command") == "tracking":
+                topic, qos = self.tracking_topic, config.get_qos(self.tracking_topic, config.tracking_qos)
+            else:
+                topic, qos = self.command_topic, config.get_qos(self.command_topic, config.command_qos)
+            with stage_timings.time("publish"):
+                publish(self.connection, message=payload, message_topic=topic, qos=qos)
+            self.sent_count += 1
+            trace = message.get("trace")
+            if trace is not None:
+                # Frame capture (producer clock) to command publish, assumes NTP-synced clocks
+                stage_timings.record("capture_to_publish", time.time() - trace["capture_time"])
+        except Exception as e:
+            self.error_count += 1
+            print(f"[WARN] Could not publish command to Pi: {e}")
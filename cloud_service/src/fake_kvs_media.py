@@ -0,0 +1,118 @@
+import os
+import glob
+import time
+import random
+
+# Directory of recorded MKV fragments to read instead of Kinesis Video Streams (unset = live KVS).
+# Fragments of a stream are taken from <dir>/<stream name>/*.mkv, or from <dir>/*.mkv for every stream.
+KVS_FAKE_MEDIA_DIR = os.getenv("KVS_FAKE_MEDIA_DIR", "")
+# Bytes per chunk, as botocore's StreamingBody iterator (1024 by default)
+KVS_FAKE_CHUNK_SIZE = int(os.getenv("KVS_FAKE_CHUNK_SIZE", 1024))
+# Random extra delay of up to this many milliseconds on each chunk
+KVS_FAKE_JITTER_MS = float(os.getenv("KVS_FAKE_JITTER_MS", 0))
+# Playback speed: 1 = real time, N = N times real time, 0 = as fast as possible
+KVS_FAKE_SPEED = float(os.getenv("KVS_FAKE_SPEED", 1))
+# Duration of one recorded fragment (seconds), used to pace the chunks in real time
+KVS_FAKE_FRAGMENT_DURATION = float(os.getenv("KVS_FAKE_FRAGMENT_DURATION", 2.0))
+# Replay the fragments forever instead of ending the stream after the last one
+KVS_FAKE_LOOP = os.getenv("KVS_FAKE_LOOP", "0") == "1"
+
+
+def list_fragment_files(media_dir, stream_name=None):
+    """Recorded MKV fragments of stream_name, in file name order (e.g. as saved by save_fragment_as_local_mkv)"""
+    stream_dir = os.path.join(media_dir, stream_name) if stream_name else media_dir
+    if not os.path.isdir(stream_dir):
+        stream_dir = media_dir
+    fragment_files = sorted(glob.glob(os.path.join(stream_dir, "*.mkv")))
+    if not fragment_files:
+        raise FileNotFoundError(f"No MKV fragments in {stream_dir}")
+    return fragment_files
+
+
+class FakeGetMediaPayload:
+    """
+    Stand-in for the StreamingBody 'Payload' of a GetMedia response: yields the bytes of stored
+    MKV fragment files in chunks, the way KvsConsumerLibrary reads them from Kinesis Video.
+
+    chunk_size is the mean chunk length (chunk_size_jitter varies it by up to that fraction),
+    jitter adds up to that many seconds of delay per chunk. With speed > 0 each fragment is spread
+    over fragment_duration / speed seconds, speed 0 delivers the bytes as fast as they are read.
+    """
+
+    def __init__(self, fragment_files, chunk_size=KVS_FAKE_CHUNK_SIZE, chunk_size_jitter=0.0,
+                 jitter=KVS_FAKE_JITTER_MS / 1000.0, speed=KVS_FAKE_SPEED,
+                 fragment_duration=KVS_FAKE_FRAGMENT_DURATION, loop=KVS_FAKE_LOOP, seed=None):
+        self.fragment_files = list(fragment_files)
+        self.chunk_size = chunk_size
+        self.chunk_size_jitter = chunk_size_jitter
+        self.jitter = jitter
+        self.speed = speed
+        self.fragment_duration = fragment_duration
+        self.loop = loop
+        self.random = random.Random(seed)
+        self.bytes_read = 0
+        self.fragments_read = 0
+        self._closed = False
+
+    def __iter__(self):
+        # Fragment files are small (a few seconds of video), read them whole and keep them for looping
+        fragments = []
+        for fragment_file in self.fragment_files:
+            with open(fragment_file, "rb") as f:
+                fragments.append(f.read())
+
+        next_time = time.monotonic()
+        while not self._closed:
+            for fragment in fragments:
+                chunks = self._split(fragment)
+                chunk_interval = self.fragment_duration / self.speed / len(chunks) if self.speed > 0 else 0
+                for chunk in chunks:
+                    if self._closed:
+                        return
+                    if chunk_interval:
+                        # Pace against a schedule so sleep overshoot does not add up over the stream
+                        next_time += chunk_interval
+                        delay = next_time - time.monotonic()
+                        if delay > 0:
+                            time.sleep(delay)
+                    if self.jitter:
+                        time.sleep(self.random.uniform(0, self.jitter))
+                    self.bytes_read += len(chunk)
+                    yield chunk
+                self.fragments_read += 1
+            if not self.loop:
+                return
+
+    def _split(self, fragment):
+        chunks = []
+        offset = 0
+        while offset < len(fragment):
+            size = self.chunk_size
+            if self.chunk_size_jitter:
+                size = int(size * self.random.uniform(1 - self.chunk_size_jitter, 1 + self.chunk_size_jitter))
+            size = max(1, size)
+            chunks.append(fragment[offset:offset + size])
+            offset += size
+        return chunks
+
+    def close(self):
+        self._closed = True
+
+
+class FakeKvsMediaClient:
+    """
+    Local stand-in for the kinesis-video-media client: get_media() replays recorded fragments
+    from media_dir, so ingest -> inference -> command can be load tested without a live stream.
+    The StartSelector is accepted and ignored, every call replays from the first fragment.
+    """
+
+    def __init__(self, media_dir=KVS_FAKE_MEDIA_DIR, **payload_options):
+        self.media_dir = media_dir
+        self.payload_options = payload_options
+
+    def get_media(self, StreamName, StartSelector=None):
+        payload = FakeGetMediaPayload(list_fragment_files(self.media_dir, StreamName), **self.payload_options)
+        return {
+            "ContentType": "video/webm",
+            "Payload": payload,
+        }
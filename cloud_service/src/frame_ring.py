@@ -0,0 +1,120 @@
+import os
+import threading
+from collections import deque, namedtuple
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Slots must cover frames being decoded, in flight to the inference workers and the one on display
+FRAME_RING_SLOTS = int(os.getenv("FRAME_RING_SLOTS", 12))
+FRAME_RING_MAX_WIDTH = int(os.getenv("FRAME_RING_MAX_WIDTH", 1280))
+FRAME_RING_MAX_HEIGHT = int(os.getenv("FRAME_RING_MAX_HEIGHT", 720))
+
+# Header: one uint64 generation counter per slot, padded to a cache line
+_HEADER_ALIGN = 64
+
+
+class StaleFrameError(RuntimeError):
+    """The slot behind a FrameRef was released and reused for another frame"""
+
+
+# Handle to a frame in the ring, small enough to send through a multiprocessing queue
+FrameRef = namedtuple("FrameRef", ["slot", "generation", "shape"])
+
+
+class FrameRing:
+    """
+    Fixed-size ring of frame slots in shared memory, so decoded frames cross the
+    decoder -> detector -> renderer stages (and process boundaries) without copying.
+
+    The creating process owns the slots: acquire() hands out a free slot with a reference
+    count of 1, retain()/release() move the count and the slot is reused once it drops to 0.
+    Every acquire bumps the slot's generation counter, stored in shared memory, so any process
+    holding a FrameRef can check the slot still holds that frame (view() raises StaleFrameError).
+
+    Other processes attach by name (attach()) and only read or write views of slots they were
+    handed; reference counting stays in the owner.
+    """
+
+    def __init__(self, num_slots=FRAME_RING_SLOTS, max_frame_shape=(FRAME_RING_MAX_HEIGHT, FRAME_RING_MAX_WIDTH, 3),
+                 name=None):
+        self.num_slots = num_slots
+        self.max_frame_shape = tuple(max_frame_shape)
+        self.slot_bytes = int(np.prod(max_frame_shape))
+        self._header_bytes = -(-num_slots * 8 // _HEADER_ALIGN) * _HEADER_ALIGN
+        self._owner = name is None
+
+        size = self._header_bytes + num_slots * self.slot_bytes
+        self._shm = shared_memory.SharedMemory(name=name, create=self._owner, size=size if self._owner else 0)
+        self._generations = np.ndarray((num_slots,), dtype=np.uint64, buffer=self._shm.buf)
+
+        if self._owner:
+            self._generations[:] = 0
+            self._condition = threading.Condition()
+            self._refcounts = [0] * num_slots
+            self._free = deque(range(num_slots))
+
+    @classmethod
+    def attach(cls, name, num_slots, max_frame_shape):
+        """Open a ring created by another process"""
+        return cls(num_slots, max_frame_shape, name=name)
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    def acquire(self, shape, timeout=None):
+        """
+        Take a free slot for a frame of the given shape (uint8). Blocks while every slot is
+        in use, so a slow consumer throttles the decoder. Returns a FrameRef, or None on timeout.
+        """
+        shape = tuple(shape)
+        if int(np.prod(shape)) > self.slot_bytes:
+            raise ValueError(f"Frame {shape} does not fit a ring slot of {self.max_frame_shape}")
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._free, timeout):
+                return None
+            slot = self._free.popleft()
+            self._refcounts[slot] = 1
+            self._generations[slot] += 1
+            return FrameRef(slot, int(self._generations[slot]), shape)
+
+    def retain(self, ref):
+        with self._condition:
+            self._check(ref)
+            self._refcounts[ref.slot] += 1
+
+    def release(self, ref):
+        """Drop one reference, the slot goes back to the free list at zero"""
+        if ref is None:
+            return
+        with self._condition:
+            self._check(ref)
+            self._refcounts[ref.slot] -= 1
+            if self._refcounts[ref.slot] == 0:
+                self._free.append(ref.slot)
+                self._condition.notify()
+
+    def is_valid(self, ref):
+        return int(self._generations[ref.slot]) == ref.generation
+
+    def view(self, ref):
+        """Zero-copy uint8 view of the frame behind ref"""
+        self._check(ref)
+        return np.ndarray(ref.shape, dtype=np.uint8, buffer=self._shm.buf,
+                          offset=self._header_bytes + ref.slot * self.slot_bytes)
+
+    def in_use(self):
+        with self._condition:
+            return self.num_slots - len(self._free)
+
+    def close(self):
+        """Detach (and free the shared memory in the owner). No views may be alive."""
+        self._generations = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+    def _check(self, ref):
+        if not self.is_valid(ref):
+            raise StaleFrameError(f"Frame slot {ref.slot} was reused (generation {ref.generation})")
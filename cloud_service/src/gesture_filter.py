@@ -0,0 +1,64 @@
+import os
+import time
+from collections import deque
+
+
+class GestureFilter:
+    """
+    Temporal filter for per-frame gesture classifications.
+
+    Keeps a sliding window of (gesture, confidence) and takes a confidence-weighted
+    majority vote. A gesture is emitted only when it becomes stable (at least min_votes
+    of the window agree) and differs from the last emitted one, or again every
+    repeat_interval seconds while it is held. Low-confidence frames and frames without
+    a hand vote for "no gesture".
+    """
+
+    def __init__(self, window_size=None, min_votes=None, min_confidence=None, repeat_interval=None):
+        # Env var fallbacks, see .env
+        self.window_size = int(window_size or os.getenv("GESTURE_WINDOW", 6))
+        self.min_votes = int(min_votes or os.getenv("GESTURE_MIN_VOTES", 4))
+        self.min_confidence = float(min_confidence or os.getenv("GESTURE_MIN_CONFIDENCE", 0.6))
+        self.repeat_interval = float(repeat_interval or os.getenv("GESTURE_REPEAT_INTERVAL", 0.5))
+
+        self.window = deque(maxlen=self.window_size)
+        self.stable_gesture = None
+        self.last_emit_time = 0.0
+
+    def reset(self):
+        self.window.clear()
+        self.stable_gesture = None
+
+    def update(self, gesture_name, confidence=1.0, now=None):
+        """
+        Add one frame's classification (gesture_name None when no hand was found).
+        Returns the gesture to send, or None.
+        """
+        now = time.monotonic() if now is None else now
+        if gesture_name is None or confidence < self.min_confidence:
+            self.window.append((None, 0.0))
+        else:
+            self.window.append((gesture_name, confidence))
+
+        votes = {}
+        scores = {}
+        for name, weight in self.window:
+            votes[name] = votes.get(name, 0) + 1
+            scores[name] = scores.get(name, 0.0) + weight
+
+        # Highest total confidence wins; "no gesture" only wins on vote count
+        winner = max(scores, key=lambda name: (scores[name], votes[name]))
+        if votes.get(None, 0) >= self.min_votes:
+            winner = None
+        if votes.get(winner, 0) < self.min_votes:
+            return None
+
+        if winner is None:
+            self.stable_gesture = None
+            return None
+
+        if winner != self.stable_gesture or now - self.last_emit_time >= self.repeat_interval:
+            self.stable_gesture = winner
+            self.last_emit_time = now
+            return winner
+        return None
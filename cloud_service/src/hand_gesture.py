@@ -2,61 +2,237 @@ import os
 import sys
 import cv2
 import numpy as np
-import mediapipe as mp
-import tensorflow as tf
 import time
-from cloud.aws.pubsub_aws_iot import publish, get_connection
+
+
+# MediaPipe hand landmark topology (mp.solutions.hands.HAND_CONNECTIONS), so landmarks can be
+# drawn from plain arrays in processes that do not load MediaPipe
+HAND_CONNECTIONS = (
+    (0, 1), (1, 2), (2, 3), (3, 4),
+    (0, 5), (5, 6), (6, 7), (7, 8),
+    (5, 9), (9, 10), (10, 11), (11, 12),
+    (9, 13), (13, 14), (14, 15), (15, 16),
+    (13, 17), (0, 17), (17, 18), (18, 19), (19, 20),
+)
+
+
+def draw_hand_landmarks(frame, points, landmark_color=(0, 255, 0), connection_color=(255, 255, 255), thickness=2):
+    """
+    Draw one hand given its (21, 2) normalized landmark array, in the same style as
+    HandGestureService.draw_landmarks.
+    """
+    frame_height, frame_width = frame.shape[:2]
+    pixels = np.minimum((points * (frame_width, frame_height)).astype(np.int32), (frame_width - 1, frame_height - 1))
+    pixels = [tuple(p) for p in np.maximum(pixels, 0).tolist()]
+    for start, end in HAND_CONNECTIONS:
+        cv2.line(frame, pixels[start], pixels[end], connection_color, thickness)
+    for pixel in pixels:
+        cv2.circle(frame, pixel, 3, (224, 224, 224), thickness)
+        cv2.circle(frame, pixel, 2, landmark_color, thickness)
+
+
+def calc_bounding_rect(image, points):
+    """[x_min, y_min, x_max, y_max] pixel box of a (21, 2) normalized landmark array"""
+    image_width, image_height = image.shape[1], image.shape[0]
+    points = points * (image_width, image_height)
+    points = np.minimum(points.astype(np.int32), (image_width - 1, image_height - 1))
+    x_min, y_min = points.min(axis=0).tolist()
+    x_max, y_max = points.max(axis=0).tolist()
+    return [x_min, y_min, x_max + 1, y_max + 1]
+
+
+def load_tflite_runtime():
+    """
+    Interpreter and OpResolverType classes, preferring the standalone tflite_runtime wheel.
+    TensorFlow is only imported (slowly, and all of it) when tflite_runtime is not installed.
+    """
+    try:
+        from tflite_runtime.interpreter import Interpreter, OpResolverType
+    except ImportError:
+        import tensorflow as tf
+        Interpreter, OpResolverType = tf.lite.Interpreter, tf.lite.experimental.OpResolverType
+    return Interpreter, OpResolverType
+
 
 class HandGestureService:
     def __init__(self, model_path='models/hand_gesture_model.tflite',                 
-                 width=960, height=540):
+                 width=None, height=None, max_num_hands=None, num_threads=None, use_xnnpack=None,
+                 roi_size=None, roi_margin=None, static_image_mode=False):
         self.model_path = model_path
-        self.width = width
-        self.height = height
+        # Resolution of the full-frame hand search, and of the crop around a tracked hand (0 disables the crop)
+        self.width = int(width or os.getenv("GESTURE_INPUT_WIDTH", 320))
+        self.height = int(height or os.getenv("GESTURE_INPUT_HEIGHT", 240))
+        self.roi_size = int(roi_size if roi_size is not None else os.getenv("GESTURE_ROI_SIZE", 192))
+        self.roi_margin = float(roi_margin or os.getenv("GESTURE_ROI_MARGIN", 0.5))
+        # Crop around the last hands, per stream when one service is shared by several cameras
+        self.rois = {}
+        # MediaPipe's own landmark tracking assumes consecutive, same-framed inputs of one camera.
+        # The crop changes size and position every frame and alternates with the full frame,
+        # so with the crop every input is processed as a still image.
+        self.static_image_mode = static_image_mode or self.roi_size > 0
         self.gesture_names = ["Up", "Down", "Left", "Right", "Left Up", "Left Down", "Right Down", "Right Up", "Fire"]
 
+        # Env var fallbacks, see .env
+        self.max_num_hands = int(max_num_hands or os.getenv("GESTURE_MAX_NUM_HANDS", 1))
+        self.num_threads = int(num_threads or os.getenv("TFLITE_NUM_THREADS", 1))
+        if use_xnnpack is None:
+            use_xnnpack = os.getenv("TFLITE_USE_XNNPACK", "1") == "1"
+        self.use_xnnpack = use_xnnpack
+
         self.mp_hands, self.hands, self.mpDraw, self.handLmsStyle, self.handConStyle = self.init_mediapipe_hands()
         self.interpreter, self.input_details, self.output_details = self.init_tflite_model()
+        self.batch_size = int(self.input_details[0]['shape'][0])
 
     def init_mediapipe_hands(self):
+        import mediapipe as mp
+
         mp_hands = mp.solutions.hands
-        hands = mp_hands.Hands(static_image_mode=False, max_num_hands=1, min_detection_confidence=0.5)
+        hands = mp_hands.Hands(static_image_mode=self.static_image_mode, max_num_hands=self.max_num_hands, min_detection_confidence=0.5)
         mpDraw = mp.solutions.drawing_utils
         handLmsStyle = mpDraw.DrawingSpec(color=(0, 255, 0), thickness=2)
         handConStyle = mpDraw.DrawingSpec(color=(255, 255, 255), thickness=2)
         return mp_hands, hands, mpDraw, handLmsStyle, handConStyle
 
     def init_tflite_model(self):
-        interpreter = tf.lite.Interpreter(model_path=self.model_path)
+        # XNNPACK is applied as a default delegate, opting out needs the resolver without default delegates
+        Interpreter, OpResolverType = load_tflite_runtime()
+        op_resolver_type = OpResolverType.AUTO
+        if not self.use_xnnpack:
+            op_resolver_type = OpResolverType.BUILTIN_WITHOUT_DEFAULT_DELEGATES
+        interpreter = Interpreter(model_path=self.model_path, num_threads=self.num_threads,
+                                  experimental_op_resolver_type=op_resolver_type)
         interpreter.allocate_tensors()
         input_details = interpreter.get_input_details()
         output_details = interpreter.get_output_details()
         return interpreter, input_details, output_details
 
+    def warm_up(self):
+        """Run one dummy frame through MediaPipe and one dummy hand through the classifier"""
+        self.hands.process(np.zeros((self.height, self.width, 3), dtype=np.uint8))
+        self.predict_batch([np.zeros((21, 2))])
+
+    def find_hands(self, frame, bgr=True, stream_id=None, frame_index=None):
+        """
+        Run MediaPipe hand landmarks on a downscaled frame, or, once a hand is known, on a crop
+        around its previous bounding box. Falls back to the full frame when the crop loses the hand.
+        Landmarks are returned in full-frame normalized coordinates (multi_hand_landmarks or None).
+        stream_id keeps the crop of each camera apart when frames of several streams are interleaved.
+        With frame_index (position of the frame in its stream), the crop is only used when it was
+        found on the stream's previous frame, e.g. not when the frames are spread over workers.
+        """
+        frame_height, frame_width = frame.shape[:2]
+        color_conversion = cv2.COLOR_BGR2RGB if bgr else None
+
+        multi_hand_landmarks = None
+        roi, roi_frame_index = self.rois.get(stream_id, (None, None))
+        if self.roi_size <= 0 or (frame_index is not None and roi_frame_index != frame_index - 1):
+            roi = None
+        if roi is not None:
+            x0, y0, x1, y1 = roi
+            crop = frame[y0:y1, x0:x1]
+            crop_width, crop_height = x1 - x0, y1 - y0
+            scale = min(1.0, self.roi_size / max(crop_width, crop_height))
+            if scale < 1.0:
+                crop = cv2.resize(crop, (max(1, int(crop_width * scale)), max(1, int(crop_height * scale))))
+            if color_conversion is not None:
+                crop = cv2.cvtColor(crop, color_conversion)
+            multi_hand_landmarks = self.hands.process(crop).multi_hand_landmarks
+            if multi_hand_landmarks:
+                # Crop-normalized -> frame-normalized, in place so drawing uses frame coordinates
+                for hand_landmarks in multi_hand_landmarks:
+                    for lm in hand_landmarks.landmark:
+                        lm.x = (lm.x * crop_width + x0) / frame_width
+                        lm.y = (lm.y * crop_height + y0) / frame_height
+
+        if not multi_hand_landmarks:
+            small = cv2.resize(frame, (self.width, self.height))
+            if color_conversion is not None:
+                small = cv2.cvtColor(small, color_conversion)
+            multi_hand_landmarks = self.hands.process(small).multi_hand_landmarks
+
+        roi = self.calc_roi(multi_hand_landmarks, frame_width, frame_height) if multi_hand_landmarks else None
+        self.rois[stream_id] = (roi, frame_index)
+        return multi_hand_landmarks
+
+    def calc_roi(self, multi_hand_landmarks, frame_width, frame_height):
+        """Pixel box around all hands, expanded by roi_margin; None when it would cover most of the frame"""
+        points = np.concatenate([self.landmarks_to_array(hand.landmark) for hand in multi_hand_landmarks])
+        (x_min, y_min), (x_max, y_max) = points.min(axis=0), points.max(axis=0)
+        # Square box so the hand keeps its aspect ratio when resized
+        size = max((x_max - x_min) * frame_width, (y_max - y_min) * frame_height) * (1 + 2 * self.roi_margin)
+        center_x, center_y = (x_min + x_max) / 2 * frame_width, (y_min + y_max) / 2 * frame_height
+        x0, y0 = int(max(0, center_x - size / 2)), int(max(0, center_y - size / 2))
+        x1, y1 = int(min(frame_width, center_x + size / 2)), int(min(frame_height, center_y + size / 2))
+        if x1 - x0 < 2 or y1 - y0 < 2 or (x1 - x0) * (y1 - y0) > 0.5 * frame_width * frame_height:
+            return None
+        return x0, y0, x1, y1
+
+    def landmarks_to_array(self, landmarks):
+        """
+        Convert hand landmarks (landmark list or NormalizedLandmarkList) to a (21, 2) float64
+        array of normalized x, y. Done once per hand and shared by normalization and bounding rect.
+        """
+        if isinstance(landmarks, np.ndarray):
+            return landmarks
+        if hasattr(landmarks, 'landmark'):
+            landmarks = landmarks.landmark
+        return np.array([(lm.x, lm.y) for lm in landmarks], dtype=np.float64)
+
     def normalize_landmarks(self, landmarks):
-        base_x, base_y = landmarks[0].x, landmarks[0].y
-        normalized = np.array([[lm.x - base_x, lm.y - base_y] for lm in landmarks])
-        return normalized.flatten()
+        points = self.landmarks_to_array(landmarks)
+        return (points - points[0]).ravel()
 
-    def process_gesture(self, landmarks):
-        normalized_landmarks = self.normalize_landmarks(landmarks)
-        input_data = np.array(normalized_landmarks, dtype=np.float32).reshape(self.input_details[0]['shape'])
-        self.interpreter.set_tensor(self.input_details[0]['index'], input_data)
+    def resize_batch(self, batch_size):
+        """Resize the interpreter input to batch_size rows (only when it changes)"""
+        if batch_size == self.batch_size:
+            return
+        input_shape = list(self.input_details[0]['shape'])
+        input_shape[0] = batch_size
+        self.interpreter.resize_tensor_input(self.input_details[0]['index'], input_shape)
+        self.interpreter.allocate_tensors()
+        self.input_details = self.interpreter.get_input_details()
+        self.output_details = self.interpreter.get_output_details()
+        self.batch_size = batch_size
+
+    def predict_batch(self, landmarks_list):
+        """
+        Classify several hands (from one or more frames) with a single invoke.
+        Returns the model output as an (n, num_classes) array.
+        """
+        batch = np.stack([self.normalize_landmarks(landmarks) for landmarks in landmarks_list]).astype(np.float32)
+        self.resize_batch(len(batch))
+        input_shape = self.input_details[0]['shape']
+        self.interpreter.set_tensor(self.input_details[0]['index'], batch.reshape(input_shape))
         self.interpreter.invoke()
-        output_data = self.interpreter.get_tensor(self.output_details[0]['index'])
-        predicted_class = np.argmax(output_data)
-        return self.gesture_names[predicted_class] if predicted_class is not None else "Stop"
+        return self.interpreter.get_tensor(self.output_details[0]['index']).reshape(len(batch), -1)
+
+    def process_gestures(self, landmarks_list):
+        """Gesture names for a list of hands, in the same order"""
+        if len(landmarks_list) == 0:
+            return []
+        output_data = self.predict_batch(landmarks_list)
+        return [self.gesture_names[predicted_class] for predicted_class in np.argmax(output_data, axis=1)]
+
+    def process_gestures_with_confidence(self, landmarks_list):
+        """(gesture name, softmax confidence) for a list of hands, in the same order"""
+        if len(landmarks_list) == 0:
+            return []
+        output_data = self.predict_batch(landmarks_list)
+        # Apply softmax unless the model already outputs probabilities
+        if np.any(output_data < 0) or not np.allclose(output_data.sum(axis=1), 1.0, atol=1e-3):
+            output_data = np.exp(output_data - output_data.max(axis=1, keepdims=True))
+            output_data /= output_data.sum(axis=1, keepdims=True)
+        predicted_classes = np.argmax(output_data, axis=1)
+        return [
+            (self.gesture_names[predicted_class], float(output_data[i, predicted_class]))
+            for i, predicted_class in enumerate(predicted_classes)
+        ]
+
+    def process_gesture(self, landmarks):
+        return self.process_gestures([landmarks])[0]
 
     def calc_bounding_rect(self, image, landmarks):
-        image_width, image_height = image.shape[1], image.shape[0]
-        landmark_array = np.empty((0, 2), int)
-        for _, landmark in enumerate(landmarks.landmark):
-            landmark_x = min(int(landmark.x * image_width), image_width - 1)
-            landmark_y = min(int(landmark.y * image_height), image_height - 1)
-            landmark_point = [np.array((landmark_x, landmark_y))]
-            landmark_array = np.append(landmark_array, landmark_point, axis=0)
-        x, y, w, h = cv2.boundingRect(landmark_array)
-        return [x, y, x + w, y + h]
+        return calc_bounding_rect(image, self.landmarks_to_array(landmarks))
 
     def calculate_fps(self, prev_time, prev_fps):
         current_time = time.time()
@@ -0,0 +1,211 @@
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from src.camera_functions import yolo_model_initialize, yolo_detect_batch, yolo_warm_up, deepsort_initialize
+from src.hand_gesture import HandGestureService
+from src.inference_pool import InferencePool, INFERENCE_WORKERS, INFERENCE_SLOTS_PER_WORKER, detect_hands_batch
+from src.frame_ring import FrameRing, FRAME_RING_SLOTS
+from src.stage_timing import stage_timings
+
+# In-process inference: frames of all robots are batched, up to INFERENCE_BATCH_SIZE frames
+# collected for at most INFERENCE_BATCH_WAIT_MS after the first one
+INFERENCE_BATCH_SIZE = int(os.getenv("INFERENCE_BATCH_SIZE", 4))
+INFERENCE_BATCH_WAIT = float(os.getenv("INFERENCE_BATCH_WAIT_MS", 5)) / 1000.0
+
+
+class InferenceEngine:
+    """
+    Models shared by every robot controller of the process: the frame ring, YOLO and the hand
+    gesture models (or the inference worker pool that holds them) and DeepSort's appearance model.
+    Per-robot state (DeepSort tracks, gesture filter, commands) stays in each controller.
+
+    Controllers hand frames over with submit(); results come back through
+    controller.apply_frame(frame_ref, detections, hands), in frame order per controller.
+    Without workers, one thread runs the frames of all robots in batches.
+    """
+
+    def __init__(self, num_streams=1, num_workers=INFERENCE_WORKERS, batch_size=INFERENCE_BATCH_SIZE,
+                 batch_wait=INFERENCE_BATCH_WAIT, warm_up=None):
+        if warm_up is None:
+            warm_up = os.getenv("MODEL_WARM_UP", "1") == "1"
+        self.warm_up_models = warm_up
+        self.num_streams = num_streams
+        self.num_workers = num_workers
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+
+        # Slots for frames in flight to inference, plus one being decoded and one on display per stream
+        in_flight = num_workers * INFERENCE_SLOTS_PER_WORKER if num_workers > 0 else 3 * batch_size
+        self.frame_ring = FrameRing(max(FRAME_RING_SLOTS, in_flight + 2 * num_streams + 1))
+
+        self.model = None
+        self.hand_gesture_service = None
+        self.inference_pool = None
+        self.class_names = None
+        self._tracker_embedder = None
+        self._spare_tracker = None
+
+        # Load models in parallel (model loading mostly waits on file IO and native code)
+        self.startup_times = {}
+        startup_start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=3, thread_name_prefix="model-load") as executor:
+            tracker_future = executor.submit(self._timed, "deepsort", deepsort_initialize)
+            if num_workers > 0:
+                # YOLO and MediaPipe live in the worker processes
+                pool_future = executor.submit(self._timed, "inference_workers", self.start_inference_pool)
+                self.inference_pool = pool_future.result()
+                self.class_names = self.inference_pool.class_names
+            else:
+                yolo_future = executor.submit(self._timed, "yolo", self.load_yolo)
+                gesture_future = executor.submit(self._timed, "hand_gesture", self.load_hand_gesture)
+                self.model = yolo_future.result()
+                self.class_names = self.model.names
+                self.hand_gesture_service = gesture_future.result()
+            self._spare_tracker = tracker_future.result()
+            self._tracker_embedder = self._spare_tracker.embedder
+        self.startup_times["models_total"] = time.monotonic() - startup_start
+
+        self._lock = threading.Lock()
+        self._next_submit_index = defaultdict(int)
+        self._controllers = {}
+        if self.inference_pool is not None:
+            self._thread = threading.Thread(target=self._collect_pool_results, name="inference-results", daemon=True)
+        else:
+            # Bounded, so a slow engine throttles the decoders
+            self._requests = queue.Queue(maxsize=2 * batch_size)
+            self._thread = threading.Thread(target=self._run_batches, name="inference-batches", daemon=True)
+        self._thread.start()
+
+    def _timed(self, name, load):
+        start = time.monotonic()
+        result = load()
+        self.startup_times[name] = time.monotonic() - start
+        return result
+
+    def load_yolo(self):
+        model = yolo_model_initialize(
+            #model_name="models/yolov8n.pt"
+        )
+        if self.warm_up_models:
+            yolo_warm_up(model)
+        return model
+
+    def load_hand_gesture(self):
+        hand_gesture_service = HandGestureService(static_image_mode=self.num_streams > 1)
+        if self.warm_up_models:
+            hand_gesture_service.warm_up()
+        return hand_gesture_service
+
+    def start_inference_pool(self):
+        pool = InferencePool(self.frame_ring, self.num_workers, warm_up=self.warm_up_models,
+                             shared_streams=self.num_streams > 1 or self.num_workers > 1)
+        pool.start()
+        return pool
+
+    def create_tracker(self):
+        """DeepSort tracker for one robot, all trackers share one appearance model"""
+        with self._lock:
+            tracker, self._spare_tracker = self._spare_tracker, None
+        return tracker or deepsort_initialize(embedder=self._tracker_embedder)
+
+    def submit(self, controller, frame_ref, detect_objects=True, find_hands=True):
+        """
+        Queue a ring frame of controller's stream. Blocks while the engine is saturated.
+        The reference on frame_ref passes to the engine and then to controller.apply_frame.
+        """
+        if self.inference_pool is not None:
+            with self._lock:
+                index = self._next_submit_index[controller.name]
+                self._next_submit_index[controller.name] += 1
+                self._controllers[controller.name] = controller
+            self.inference_pool.submit(frame_ref, (controller.name, index), detect_objects, find_hands,
+                                       stream_id=controller.name)
+        else:
+            self._requests.put((controller, frame_ref, detect_objects, find_hands))
+
+    def infer_batch(self, batch):
+        """
+        Run one batch of (controller, frame_ref, detect_objects, find_hands) requests.
+        Returns (detections, hands) per request, None where not requested.
+        """
+        frames = [self.frame_ring.view(frame_ref) for _, frame_ref, _, _ in batch]
+
+        detections = [None] * len(batch)
+        detect = [i for i, request in enumerate(batch) if request[2]]
+        if detect:
+            with stage_timings.time("yolo"):
+                batch_detections = yolo_detect_batch(self.model, [frames[i] for i in detect])
+            for i, frame_detections in zip(detect, batch_detections):
+                detections[i] = frame_detections
+
+        hands = [None] * len(batch)
+        find = [i for i, request in enumerate(batch) if request[3]]
+        if find:
+            with stage_timings.time("gesture"):
+                batch_hands = detect_hands_batch(
+                    self.hand_gesture_service, [frames[i] for i in find], [batch[i][0].name for i in find]
+                )
+            for i, frame_hands in zip(find, batch_hands):
+                hands[i] = frame_hands
+
+        return list(zip(detections, hands))
+
+    def _run_batches(self):
+        while True:
+            batch = [self._requests.get()]
+            deadline = time.monotonic() + self.batch_wait
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._requests.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                with stage_timings.time("inference"):
+                    results = self.infer_batch(batch)
+            except Exception as e:
+                print(f"Inference error: {e}")
+                results = [(None, None)] * len(batch)
+
+            # apply_frame releases the frames, so it runs even when inference failed
+            for (controller, frame_ref, _, _), (detections, hands) in zip(batch, results):
+                try:
+                    controller.apply_frame(frame_ref, detections, hands)
+                except Exception as e:
+                    print(f"Error applying inference result for {controller.name}: {e}")
+
+    def _collect_pool_results(self):
+        """Apply worker results in frame order per robot, DeepSort and the gesture filter are sequential"""
+        pending = {}
+        next_index = defaultdict(int)
+        while True:
+            try:
+                result = self.inference_pool.get_result()
+            except Exception as e:
+                print(f"Inference worker error: {e}")
+                continue
+            if result["error"] is not None:
+                # Applied as a frame without detections, so the robot's later frames are not held back
+                print(f"[WARN] Inference failed for frame {result['frame_index']}: {result['error']}")
+            else:
+                stage_timings.record("inference", result["inference_time"])
+                # Stage times measured in the worker process
+                for stage, seconds in result["stage_times"].items():
+                    stage_timings.record(stage, seconds)
+            name, index = result["frame_index"]
+            pending[(name, index)] = result
+            while (name, next_index[name]) in pending:
+                result = pending.pop((name, next_index[name]))
+                next_index[name] += 1
+                controller = self._controllers[name]
+                try:
+                    controller.apply_frame(result["frame_ref"], result["detections"], result["hands"])
+                except Exception as e:
+                    print(f"Error applying inference result for {name}: {e}")
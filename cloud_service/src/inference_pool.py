@@ -0,0 +1,287 @@
+import os
+import queue
+import threading
+import time
+import multiprocessing
+
+from src.camera_functions import yolo_model_initialize, yolo_detect, yolo_warm_up
+from src.hand_gesture import HandGestureService
+from src.frame_ring import FrameRing
+
+# Number of inference worker processes, 0 keeps inference on the controller thread
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", 0))
+# Frames in flight per worker
+INFERENCE_SLOTS_PER_WORKER = int(os.getenv("INFERENCE_SLOTS_PER_WORKER", 2))
+# Seconds after which a frame without result is given up (e.g. its worker died), 0 waits forever
+INFERENCE_RESULT_TIMEOUT = float(os.getenv("INFERENCE_RESULT_TIMEOUT", 10))
+
+
+def detect_hands_batch(hand_gesture_service, frames, stream_ids=None, frame_indexes=None):
+    """
+    Hand landmarks and gestures for BGR frames, without drawing on them. MediaPipe runs per frame,
+    the gestures of all hands in all frames are classified with a single interpreter invoke.
+    stream_ids / frame_indexes (position in the stream) are passed to find_hands.
+    Returns, per frame, a list of (landmark points (21, 2) normalized, gesture name, confidence).
+    """
+    stream_ids = stream_ids or [None] * len(frames)
+    frame_indexes = frame_indexes or [None] * len(frames)
+    frame_points = []
+    for frame, stream_id, frame_index in zip(frames, stream_ids, frame_indexes):
+        multi_hand_landmarks = hand_gesture_service.find_hands(frame, stream_id=stream_id,
+                                                               frame_index=frame_index) or []
+        frame_points.append([
+            hand_gesture_service.landmarks_to_array(hand_landmarks.landmark)
+            for hand_landmarks in multi_hand_landmarks
+        ])
+
+    gestures = iter(hand_gesture_service.process_gestures_with_confidence(
+        [points for hands in frame_points for points in hands]
+    ))
+    return [
+        [(points, *next(gestures)) for points in hands]
+        for hands in frame_points
+    ]
+
+
+def detect_hands(hand_gesture_service, frame, stream_id=None, frame_index=None):
+    return detect_hands_batch(hand_gesture_service, [frame], [stream_id], [frame_index])[0]
+
+
+def _worker_main(worker_id, ring_name, num_slots, max_frame_shape, task_queue, result_queue, warm_up, shared_streams):
+    """
+    Inference worker process. Loads its own YOLO model and HandGestureService, then for each task
+    reads the frame straight from the shared ring and returns the YOLO detections and hands.
+    Workers only read frames: drawing happens in the controller once DeepSort is done with the frame.
+    """
+    ring = FrameRing.attach(ring_name, num_slots, max_frame_shape)
+    # Task being processed, reported with a fatal error so the pool can give its frame back
+    frame_ref, frame_index = None, None
+    try:
+        model = yolo_model_initialize()
+        hand_gesture_service = HandGestureService(static_image_mode=shared_streams)
+        if warm_up:
+            yolo_warm_up(model)
+            hand_gesture_service.warm_up()
+        result_queue.put(("ready", worker_id, model.names))
+
+        while True:
+            task = task_queue.get()
+            if task is None:
+                break
+            frame_ref, frame_index, stream_id, detect_objects, find_hands = task
+            # The engine numbers frames per stream, (stream, index)
+            stream_frame_index = frame_index[1] if isinstance(frame_index, tuple) else None
+            start = time.monotonic()
+            stage_times = {}
+            try:
+                frame = ring.view(frame_ref)
+                detections, hands = None, None
+                if detect_objects:
+                    detections = yolo_detect(model, frame)
+                    stage_times["yolo"] = time.monotonic() - start
+                if find_hands:
+                    hands_start = time.monotonic()
+                    hands = detect_hands(hand_gesture_service, frame, stream_id, stream_frame_index)
+                    stage_times["gesture"] = time.monotonic() - hands_start
+                del frame
+            except Exception as e:
+                # Still answer, the controller applies results in frame order and waits for this one
+                print(f"Inference worker {worker_id} error on frame {frame_index}: {e}")
+                detections, hands = None, None
+            result_queue.put(("result", frame_ref, frame_index, detections, hands, time.monotonic() - start,
+                              stage_times))
+            frame_ref, frame_index = None, None
+    except Exception as e:
+        result_queue.put(("error", worker_id, repr(e), frame_ref, frame_index))
+    finally:
+        ring.close()
+
+
+class InferencePool:
+    """
+    Pool of inference worker processes so YOLO, MediaPipe and their Python pre/post-processing
+    run outside the controller's GIL.
+
+    Frames stay in the shared FrameRing; only FrameRefs and small results go through the
+    queues. The caller keeps its reference on a frame from submit() until it has applied the
+    result. At most num_workers * slots_per_worker frames are in flight, submit() blocks beyond
+    that (backpressure on the caller).
+
+    DeepSort and the gesture filter are stateful and stay in the controller, which applies the
+    results in frame order (results may complete out of order across workers). So every submitted
+    frame gets exactly one result: a worker that fails on a frame reports it, dead workers are
+    restarted and frames still without result after result_timeout come back as an empty result
+    with an "error". A late result of a given up frame is dropped.
+    """
+
+    def __init__(self, frame_ring, num_workers=INFERENCE_WORKERS, slots_per_worker=INFERENCE_SLOTS_PER_WORKER,
+                 warm_up=True, shared_streams=False, result_timeout=INFERENCE_RESULT_TIMEOUT):
+        self.frame_ring = frame_ring
+        # A worker does not see consecutive frames of one camera: several cameras interleave,
+        # or one camera's frames are spread over several workers
+        self.shared_streams = shared_streams or num_workers > 1
+        self.num_workers = num_workers
+        self.warm_up = warm_up
+        self.result_timeout = result_timeout
+        self.class_names = None
+
+        # spawn: the controller process already runs Flask, MQTT and KVS threads
+        self._context = multiprocessing.get_context("spawn")
+        self._task_queue = self._context.Queue()
+        self._result_queue = self._context.Queue()
+        self._in_flight = threading.Semaphore(num_workers * slots_per_worker)
+        self._workers = []
+        # frame_index -> (frame_ref, submit time) of the frames waiting for a result
+        self._outstanding = {}
+        self._outstanding_lock = threading.Lock()
+        self._last_health_check = time.monotonic()
+        self._closing = False
+
+    def _start_worker(self, worker_id):
+        worker = self._context.Process(
+            target=_worker_main,
+            args=(worker_id, self.frame_ring.name, self.frame_ring.num_slots, self.frame_ring.max_frame_shape,
+                  self._task_queue, self._result_queue, self.warm_up, self.shared_streams),
+            name=f"inference-worker-{worker_id}",
+            daemon=True,
+        )
+        worker.start()
+        return worker
+
+    def start(self, timeout=300):
+        """
+        Start the workers and wait until each has loaded and warmed up its models.
+        Raises RuntimeError (with every worker stopped) if one fails or the timeout passes.
+        """
+        try:
+            for worker_id in range(self.num_workers):
+                self._workers.append(self._start_worker(worker_id))
+
+            deadline = time.monotonic() + timeout
+            ready = 0
+            while ready < self.num_workers:
+                try:
+                    message = self._result_queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    raise RuntimeError(f"Inference workers not ready after {timeout}s ({ready}/{self.num_workers})")
+                if message[0] == "error":
+                    raise RuntimeError(f"Inference worker {message[1]} failed to start: {message[2]}")
+                ready += 1
+                self.class_names = message[2]
+        except BaseException:
+            self._terminate()
+            raise
+
+    def submit(self, frame_ref, frame_index, detect_objects=True, find_hands=True, stream_id=None, timeout=None):
+        """
+        Queue a ring frame for inference. frame_index is returned with the result as is.
+        Returns False on timeout.
+        """
+        if not self._in_flight.acquire(timeout=timeout):
+            return False
+        with self._outstanding_lock:
+            self._outstanding[frame_index] = (frame_ref, time.monotonic())
+        self._task_queue.put((frame_ref, frame_index, stream_id, detect_objects, find_hands))
+        return True
+
+    def get_result(self, timeout=None):
+        """
+        Next completed frame as a dict (frame_ref, frame_index, detections, hands, inference_time,
+        stage_times, error), or None on timeout. detections / hands are None when not requested or
+        when the frame failed (error says why), stage_times holds the yolo / gesture durations
+        measured in the worker.
+        Raises RuntimeError when a worker fails outside a frame (it is restarted).
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            # Checked about once a second, also while results keep arriving
+            now = time.monotonic()
+            if now - self._last_health_check >= 1.0:
+                self._last_health_check = now
+                self._restart_dead_workers()
+                result = self._expire_outstanding()
+                if result is not None:
+                    return result
+
+            wait = 1.0 if deadline is None else min(1.0, deadline - now)
+            try:
+                message = self._result_queue.get(timeout=max(0.0, wait))
+            except queue.Empty:
+                if deadline is not None and time.monotonic() >= deadline:
+                    return None
+                continue
+
+            if message[0] == "result":
+                _, frame_ref, frame_index, detections, hands, inference_time, stage_times = message
+                if self._complete(frame_index) is not None:
+                    return self._result(frame_ref, frame_index, detections, hands, inference_time, stage_times)
+            elif message[0] == "error":
+                _, worker_id, error, frame_ref, frame_index = message
+                if frame_index is None:
+                    raise RuntimeError(f"Inference worker {worker_id} failed: {error}")
+                if self._complete(frame_index) is not None:
+                    return self._result(frame_ref, frame_index, error=f"worker {worker_id} failed: {error}")
+            # "ready" of a restarted worker: nothing to return
+
+    def _complete(self, frame_index):
+        """Forget an outstanding frame and free its slot, None if it was already given up"""
+        with self._outstanding_lock:
+            entry = self._outstanding.pop(frame_index, None)
+        if entry is not None:
+            self._in_flight.release()
+        return entry
+
+    def _expire_outstanding(self):
+        """Give up the oldest frame waiting longer than result_timeout, as an empty result"""
+        if self.result_timeout <= 0:
+            return None
+        now = time.monotonic()
+        with self._outstanding_lock:
+            expired = [(submit_time, frame_index) for frame_index, (_, submit_time) in self._outstanding.items()
+                       if now - submit_time > self.result_timeout]
+        if not expired:
+            return None
+        _, frame_index = min(expired)
+        entry = self._complete(frame_index)
+        if entry is None:
+            return None
+        return self._result(entry[0], frame_index, error=f"no result after {self.result_timeout}s")
+
+    def _restart_dead_workers(self):
+        if self._closing:
+            return
+        for worker_id, worker in enumerate(self._workers):
+            if not worker.is_alive():
+                print(f"[WARN] Inference worker {worker_id} died (exit code {worker.exitcode}), restarting")
+                self._workers[worker_id] = self._start_worker(worker_id)
+
+    @staticmethod
+    def _result(frame_ref, frame_index, detections=None, hands=None, inference_time=0.0, stage_times=None,
+                error=None):
+        return {
+            "frame_ref": frame_ref,
+            "frame_index": frame_index,
+            "detections": detections,
+            "hands": hands,
+            "inference_time": inference_time,
+            "stage_times": stage_times or {},
+            "error": error,
+        }
+
+    def _terminate(self):
+        self._closing = True
+        for worker in self._workers:
+            if worker.is_alive():
+                worker.terminate()
+            worker.join(1)
+        self._workers = []
+
+    def shutdown(self, timeout=5):
+        self._closing = True
+        for _ in self._workers:
+            self._task_queue.put(None)
+        for worker in self._workers:
+            worker.join(timeout)
+            if worker.is_alive():
+                worker.terminate()
+        self._workers = []
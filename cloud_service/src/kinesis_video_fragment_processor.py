@@ -15,13 +15,16 @@ __copyright__ = "Copyright Amazon.com, Inc. or its affiliates. All Rights Reserv
 __author__ = "Dean Colcott <https://www.linkedin.com/in/deancolcott/>"
 
 import io
+import time
 import logging
+import av
 import imageio.v3 as iio
 import src.ebmlite.util as emblite_utils
 import wave
 import src.ebmlite.decoding as ebmlite_decoding
 import boto3
 import cv2
+from src.stage_timing import stage_timings
 from src.robot_controller import ObjectTrackingRobotController
 from src.web_app import WebApp
 
@@ -34,10 +37,19 @@ class KvsFragementProcessor():
     first_time = True
     
 
-    def __init__(self):
-        self.robot_controller = ObjectTrackingRobotController()
-        self.webapp = WebApp(self.robot_controller)
-        self.webapp.run()
+    def __init__(self, robot_controller=None):
+        '''
+        robot_controller: controller of the robot this stream drives (see RobotFleet). Without one,
+        a standalone controller and its WebApp are created.
+        '''
+        self.webapp = None
+        if robot_controller is None:
+            robot_controller = ObjectTrackingRobotController()
+            self.webapp = WebApp(robot_controller)
+            self.webapp.run()
+        self.robot_controller = robot_controller
+        # Decoded frames are written straight into the controller's shared frame ring
+        self.frame_ring = self.robot_controller.frame_ring
 
     ####################################################
     # Fragment processing functions
@@ -172,15 +184,78 @@ class KvsFragementProcessor():
 
         return ret_frames
 
-    def process_frame_to_robot(self, fragment_bytes, one_in_frames_ratio):
-        ndarray_frames = self.get_frames_as_ndarray(fragment_bytes, one_in_frames_ratio)
+    def decode_frames_to_ring(self, fragment_bytes, one_in_frames_ratio):
+        '''
+        Decodes fragment_bytes and writes a ratio of the frames, as BGR, straight into slots
+        of self.frame_ring (same frame selection as get_frames_as_ndarray).
+
+        Every frame still has to be decoded, but only the returned ones are colour converted,
+        directly from the decoder's YUV planes into the slot.
+
+        ### Parameters:
+
+            fragment_bytes: bytearray
+                A ByteArray with raw bytes from exactly one fragment.
+
+            one_in_frames_ratio: int
+                Ratio of the available frames in the fragment to process and return.
 
+        ### Return:
 
-        for i in range(len(ndarray_frames)):
-            frame = ndarray_frames[i]
-            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            frames: Generator<(FrameRef, int, float)>
+            Per selected frame: its FrameRef, its index in the fragment and its presentation time (s)
+            relative to the first frame of the fragment. The caller owns the reference and must release it.
+        '''
 
-            self.robot_controller.process_frame(frame_rgb)
+        with av.open(io.BytesIO(fragment_bytes)) as container:
+            stream = container.streams.video[0]
+            stream.thread_type = "AUTO"
+            # Decode time of a returned frame includes the skipped frames decoded before it
+            decode_start = time.perf_counter()
+            first_frame_time = None
+            for i, frame in enumerate(container.decode(stream)):
+                if first_frame_time is None:
+                    first_frame_time = frame.time or 0.0
+                if i % one_in_frames_ratio:
+                    continue
+                stage_timings.record("decode", time.perf_counter() - decode_start)
+
+                frame_ref = self.frame_ring.acquire((frame.height, frame.width, 3))
+                with stage_timings.time("color_conversion"):
+                    slot = self.frame_ring.view(frame_ref)
+                    if frame.format.name == "yuv420p" and frame.width % 2 == 0 and frame.height % 2 == 0:
+                        cv2.cvtColor(frame.to_ndarray(), cv2.COLOR_YUV2BGR_I420, dst=slot)
+                    else:
+                        slot[...] = frame.to_ndarray(format="bgr24")
+                    del slot
+                yield frame_ref, i, (frame.time or first_frame_time) - first_frame_time
+                decode_start = time.perf_counter()
+
+    def get_producer_timestamp(self, fragment_tags):
+        '''
+        AWS_KINESISVIDEO_PRODUCER_TIMESTAMP of a fragment (seconds since epoch, producer clock) from
+        the tags returned by get_fragment_tags(), or None when missing.
+        '''
+        try:
+            return float(fragment_tags['AWS_KINESISVIDEO_PRODUCER_TIMESTAMP'])
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def process_frame_to_robot(self, fragment_bytes, one_in_frames_ratio, producer_timestamp=None):
+        '''
+        Decode the fragment into the frame ring and hand the selected frames to the robot controller.
+        With the fragment's producer timestamp, every frame carries a trace (see aws.command_codec)
+        that follows it through detection into the commands it triggers.
+        '''
+        for frame_ref, frame_index, frame_time in self.decode_frames_to_ring(fragment_bytes, one_in_frames_ratio):
+            trace = None
+            if producer_timestamp is not None:
+                trace = {
+                    "producer_timestamp": producer_timestamp,
+                    "frame_index": frame_index,
+                    "capture_time": producer_timestamp + frame_time,
+                }
+            self.robot_controller.process_frame(self.frame_ring.view(frame_ref), frame_ref, trace)
 
     def get_raw_audio_track_from_simple_block(self, mkv_element):
         '''
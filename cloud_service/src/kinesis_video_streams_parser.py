@@ -45,6 +45,7 @@ import timeit
 import logging
 from threading import Thread
 from src.ebmlite import loadSchema
+from src.stage_timing import stage_timings
 
 # Init the logger.
 log = logging.getLogger(__name__)
@@ -157,6 +158,9 @@ class KvsConsumerLibrary(Thread):
             fragment_read_start_time = timeit.default_timer()
 
             chunk_read_count = 0
+
+            # Time spent re-parsing the buffer to find fragment boundaries, summed over the chunks of a fragment
+            fragment_framing_time = 0.0
             
             # Uses the StreamingBody object iterator to read in (default 1024 byte) chunks from the streaming buffer.
             for chunk in kvs_streaming_buffer:
@@ -166,6 +170,7 @@ class KvsConsumerLibrary(Thread):
 
                 # Append chunk bytes to ByteArray buffer while waiting for the entire MKV fragment to arrive.
                 chunk_buffer.extend(chunk)
+                framing_start = timeit.default_timer()
 
                 #############################################
                 # Parse current byte buffer to MKV EBML DOM like object using EBMLite
@@ -178,6 +183,7 @@ class KvsConsumerLibrary(Thread):
                 # EBML header elements indicate the start of a new fragment. Here we check if the start of a second fragment
                 # has arrived and use its start to identify the byte boundary of the first complete fragment to process.
                 ebml_header_elements = self._get_ebml_header_elements(fragement_intrum_dom)
+                fragment_framing_time += timeit.default_timer() - framing_start
 
                 # If multiple fragment headers then the first fragment has been received completely and ready to process.
                 if (len(ebml_header_elements) > 1):
@@ -190,7 +196,11 @@ class KvsConsumerLibrary(Thread):
                     fragment_bytes = chunk_buffer[first_ebml_header_offset : second_ebml_header_offset]
 
                     # Parse the complete fragment as EBML to a DOM like object
+                    dom_parse_start = timeit.default_timer()
                     fragment_dom = self.schema.loads(fragment_bytes)
+                    stage_timings.record("dom_parse", timeit.default_timer() - dom_parse_start)
+                    stage_timings.record("fragment_framing", fragment_framing_time)
+                    fragment_framing_time = 0.0
 
                     # Calculate duration taken receiving this fragment - just for telemetry of the steaming data. 
                     fragment_receive_duration = timeit.default_timer() - fragment_read_start_time
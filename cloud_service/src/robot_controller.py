@@ -3,46 +3,96 @@ import os
 import cv2
 import threading
 import time
-from src.camera_functions import yolo_results, yolo_ds_draw, yolo_ds_model_initialize, yolo_ds_update
-import json
+from src.camera_functions import yolo_ds_draw, yolo_ds_update
 
-from src.hand_gesture import HandGestureService
+from src.hand_gesture import draw_hand_landmarks, calc_bounding_rect
+from src.gesture_filter import GestureFilter
+from src.tracking_control import compute_tracking_move, compute_tracking_tilt
+from src.inference_engine import InferenceEngine
+from src.stage_timing import stage_timings
 
-from aws.pubsub_aws_iot import publish, get_connection
+from aws.pubsub_aws_iot import ConnectionManager
+from src.command_publisher import CommandPublisher
 
 class ObjectTrackingRobotController:
-    def __init__(self, pi_ip=None):
-        # Frame handling and tracking state
+    def __init__(self, pi_ip=None, name="robot", engine=None, client_id="pi_sender",
+                 command_topic=None, tracking_topic=None):
+        """
+        One robot: its stream's tracker and gesture state and its command topics.
+        engine is the InferenceEngine shared by all robots of the process, a private one is
+        created (and its models loaded) when not given.
+        """
+        self.name = name
+        self.client_id = client_id
+
+        # Frame handling and tracking state. Frames live in the engine's shared memory ring: the decoder
+        # writes into a slot, inference reads it and the slot is annotated in place for the web stream.
         self.frame_lock = threading.Lock()
         self.latest_frame = None
         self.annotated_frame = None
+        self._display_ref = None
         self.last_detections = []
         self.frame_count = 0
+        # (submit time, trace) of the frames in flight, for the submit -> applied "frame" stage time
+        # and the trace attached to commands (see aws.command_codec)
+        self._frames_in_flight = {}
+        # Trace of the frame being applied, commands it triggers carry it to the Pi
+        self.frame_trace = None
         self.tracking_defined = False
         self.target_id = None
         self.target_class_label = None
         self.tracking_action = ""
+        # Last tracking setpoint sent was a motion, the next zero one is sent to stop the robot
+        self.tracking_moving = False
 
         self.PI_IP = pi_ip
+
+        # Camera tilt control: degrees per unit of vertical offset and centred dead band
+        self.tilt_gain = float(os.getenv("CAMERA_TILT_GAIN", 10))
+        self.tilt_dead_band = float(os.getenv("CAMERA_TILT_DEAD_BAND", 0.2))
+
+        # Start the MQTT connection in the background so the TLS handshake overlaps model loading
+        ConnectionManager().warm_up(client_id)
+
+        self.startup_times = {}
+        if engine is None:
+            engine = InferenceEngine()
+            self.startup_times.update(engine.startup_times)
+        self.engine = engine
+        self.frame_ring = engine.frame_ring
+        self.class_names = engine.class_names
+        self.tracker = engine.create_tracker()
+        self.gesture_filter = GestureFilter()
         
-        # Initialize models
-        self.model, self.class_names, self.tracker = yolo_ds_model_initialize(
-            #model_name="models/yolov8n.pt"
-        )
-        self.hand_gesture_service = HandGestureService()
-        
-        self.connection = get_connection("pi_sender")
+        self.command_publisher = CommandPublisher(client_id=client_id, command_topic=command_topic,
+                                                  tracking_topic=tracking_topic)
+        self.command_publisher.start()
 
         # Frame counters
         self.frame_count_move_robot = 0
         self.frame_count_yolo = 0
-        self.frame_count_gesture = 0
         
-        # Timing for FPS calculation
+        # Timing for FPS calculation, updated on every applied frame (exported on /metrics)
         self.prev_time = time.time()
         self.prev_fps = 0
+        self.frames_applied = 0
+
+        self.report_startup_times()
+
+    def report_startup_times(self):
+        """Print how long each model (load + warm-up) and the MQTT connection took"""
+        mqtt_time = ConnectionManager().connect_duration(self.client_id)
+        self.startup_times["mqtt"] = mqtt_time
+        parts = [f"{name}={seconds:.2f}s" for name, seconds in self.startup_times.items() if seconds is not None]
+        if mqtt_time is None:
+            parts.append("mqtt=connecting")
+        print(f"[{self.name}] Startup times: " + ", ".join(parts))
         
     
+    def frames_in_flight(self):
+        """Number of frames submitted to the inference engine and not applied yet"""
+        return len(self._frames_in_flight)
+
     def update_tracking_action(self, action):
         """Update current tracking action (for frontend display)"""
         self.tracking_action = action
@@ -53,145 +103,181 @@ class ObjectTrackingRobotController:
         Returns: (vx, vy, omega)
         """
         frame_height, frame_width, _ = frame.shape
-
-        # Define horizontal thresholds (left/center/right)
-        left_threshold = frame_width // 3
-        right_threshold = 2 * frame_width // 3
-
-        # Get object center coordinates
-        center_x, center_y = object_center[2], object_center[3]
-
-        # Motion control variables
-        vx = 0       # Left-right movement
-        vy = 0       # Forward-backward movement
-        omega = 0    # Rotation
-
-        frame_area = frame_height * frame_width
-        
-        l, t, r, b = ltrb
-        area_bbox = (r - l) * (b - t)
-
-        speed = 0.4
-        if area_bbox < 0.2 * frame_area or b - t <= (0.50*frame_height):
-            vy = speed
-        elif area_bbox > 0.6 * frame_area or b - t >= (0.85*frame_height): 
-            vy = -speed
-        
-        speed = 0.25
-        # Decide rotation based on horizontal object position
-        if center_x < left_threshold:
-            omega = speed  # Rotate left
-            action = "Turn Left"
-        elif center_x > right_threshold:
-            omega = -speed  # Rotate right
-            action = "Turn Right"
-        else:
-            omega = 0
-            action = "no action"
+        vx, vy, omega, action = compute_tracking_move(object_center[2], frame_width, frame_height, ltrb)
 
         self.update_tracking_action(action)
         return vx, vy, omega
 
+    def tracking_tilt(self, object_center, frame):
+        """
+        Camera tilt adjustment (degrees, relative) that keeps the object vertically centred.
+        """
+        return compute_tracking_tilt(object_center[3], frame.shape[0], self.tilt_gain, self.tilt_dead_band)
+
     def send_gesture_command(self, gesture_name):
-        """Send gesture command to Raspberry Pi"""
-        try:
+        """Queue gesture command for the Raspberry Pi (non-blocking)"""
+        message_json={
+            "command": "gesture",
+            "gesture": gesture_name
+        }
+        # GestureFilter already paces the repeats of a held gesture
+        self.command_publisher.submit(self.add_frame_trace(message_json), dedupe=False)
+
+    def send_target_command(self, class_label):
+        """Tell the Pi which object class to follow (used by the edge inference mode)"""
+        message_json={
+            "command": "target",
+            "class_label": class_label
+        }
+        self.command_publisher.submit(message_json, coalesce=False)
+
+    def send_tracking_command(self, vx, vy, omega, tilt=0):
+        """
+        Queue motion (and camera tilt) command for the Raspberry Pi (non-blocking).
+        The Pi holds each setpoint for a while, so the first zero setpoint after a motion is
+        sent too, to stop the robot right away. Further zero setpoints are skipped.
+        """
+        moving = omega != 0 or vy != 0 or vx != 0 or tilt != 0
+        if moving or self.tracking_moving:
             message_json={
-                "command": "gesture",
-                "gesture": gesture_name
+                "command": "tracking",
+                "vx": vx,
+                "vy": vy,
+                "omega": omega,
+                "tilt": tilt
             }
-            json_string = json.dumps(message_json)
-            print(f"sending gesture: {message_json}")
-            publish(self.connection, message=json_string)
-        except Exception as e:
-            print(f"[WARN] Could not send gesture data to Pi: {e}")
-
-    def send_tracking_command(self, vx, vy, omega):
-        try:
-            if omega != 0 or vy != 0 or vx != 0:
-                message_json={
-                    "command": "tracking",
-                    "vx": vx,
-                    "vy": vy,
-                    "omega": omega
-                }
-                json_string = json.dumps(message_json)
-                # Send motion command to Raspberry Pi
-                publish(self.connection, message=json_string)
-        except Exception as e:
-            print(f"[WARN] Could not send motion data to Pi: {e}")
-
-    def process_frame(self, frame):
-        self.frame_count_move_robot += 1
+            self.command_publisher.submit(self.add_frame_trace(message_json))
+        self.tracking_moving = moving
+
+    def add_frame_trace(self, message_json):
+        """Attach the trace of the frame being applied, if it has one"""
+        if self.frame_trace is not None:
+            message_json["trace"] = self.frame_trace
+        return message_json
+
+    def process_frame(self, frame, frame_ref=None, trace=None):
+        """
+        Queue one BGR frame for inference, results are applied by apply_frame. With frame_ref the
+        frame is a view of a frame_ring slot and the caller's reference passes to the controller,
+        which annotates the slot in place and releases it once the next frame replaces it on the
+        web stream. Other frames are copied into a slot.
+        trace (producer timestamp, frame index, capture time) is attached to the commands the frame triggers.
+        """
+        submit_time = time.perf_counter()
+        if frame_ref is None:
+            frame_ref = self.frame_ring.acquire(frame.shape)
+            self.frame_ring.view(frame_ref)[...] = frame
+        self._frames_in_flight[frame_ref] = (submit_time, trace)
+
+        # Process YOLO every 2 frames, hand gestures if not tracking an object
         self.frame_count_yolo += 1
-        self.frame_count_gesture += 1
-        
+        detect_objects = self.frame_count_yolo >= 2
+        if detect_objects:
+            self.frame_count_yolo = 0
+        self.engine.submit(self, frame_ref, detect_objects, not self.tracking_defined)
+
+    def apply_frame(self, frame_ref, detections, hands):
+        """
+        Update DeepSort, follow the target, handle gestures and annotate the frame for display.
+        detections / hands are None when they were not computed for this frame.
+        Takes over the reference on frame_ref.
+        """
+        apply_start = time.perf_counter()
+        submit_time, self.frame_trace = self._frames_in_flight.pop(frame_ref, (None, None))
+        frame = self.frame_ring.view(frame_ref)
+        self.frame_count_move_robot += 1
+        self.frames_applied += 1
+        self.prev_fps, self.prev_time = self.calculate_fps(self.prev_time, self.prev_fps)
+
         with self.frame_lock:
-            self.latest_frame = frame.copy()
-            self.annotated_frame = self.latest_frame
+            try:
+                if detections is not None:
+                    with stage_timings.time("tracking"):
+                        self.last_detections = yolo_ds_update(frame, detections, self.tracker)
 
-            self.process_object_detection(frame)
-            self.process_hand_gesture(frame)
+                # DeepSort was the last reader of the raw frame, annotate the slot in place from here on
+                self.annotated_frame = frame
+                if detections is not None:
+                    _, objects_centers, ltrb = yolo_ds_draw(frame, self.last_detections, self.class_names, copy=False)
+                    self.follow_target(objects_centers, frame, ltrb)
 
-    def process_object_detection(self, frame):
-        # Process YOLO every 5 frames
-        if self.frame_count_yolo >= 2:
-            self.frame_count_yolo = 0
-            
-            results, detections = yolo_results(self.model, self.latest_frame)
-            self.last_detections = yolo_ds_update(self.latest_frame, detections, self.tracker)
+                if hands is not None:
+                    for points, _, _ in hands:
+                        draw_hand_landmarks(frame, points)
+                        brect = calc_bounding_rect(frame, points)
+                        cv2.rectangle(frame, (brect[0], brect[1]), (brect[2], brect[3]), (0, 255, 0), 2)
+                    self.handle_gestures([(gesture_name, confidence) for _, gesture_name, confidence in hands])
+                    self.draw_fps()
+            finally:
+                self.frame_trace = None
+                self.latest_frame = frame
+                self.annotated_frame = frame
+                previous_ref, self._display_ref = self._display_ref, frame_ref
+
+        self.frame_ring.release(previous_ref)
+
+        apply_end = time.perf_counter()
+        stage_timings.record("apply", apply_end - apply_start)
+        if submit_time is not None:
+            stage_timings.record("frame", apply_end - submit_time)
+
+    def follow_target(self, objects_centers, frame, ltrb):
+        # If user has selected a target, calculate movement and send to Pi
+        if self.tracking_defined and self.frame_count_move_robot >= 8:
+            self.frame_count_move_robot = 0
+
+            # Find the object center based on ID
+            object_center = None
+            for obj in objects_centers:
+                if obj[0] == str(self.target_id):
+                    object_center = obj
+                    break
+
+            if object_center is not None:
+                vx, vy, omega = self.tracking_move(object_center, frame, ltrb)
+                tilt = self.tracking_tilt(object_center, frame)
+                self.send_tracking_command(vx, vy, omega, tilt)
+            else:
+                self.tracking_defined = False
+                self.send_tracking_command(0, 0, 0)
+
+    def handle_gestures(self, gestures):
+        """
+        Send the first hand's gesture once stable and label the frame.
+        gestures: list of (gesture name, confidence), one per detected hand.
+        """
+        if not gestures:
+            self.gesture_filter.update(None)
+            return
+
+        for i, (gesture_name, confidence) in enumerate(gestures):
+            if("Fire" == gesture_name):
+                gesture_name = "Up"
+
+            # The first detected hand controls the robot. Only stable gesture changes
+            # (or held gestures at the repeat rate) are sent.
+            if i == 0:
+                stable_gesture = self.gesture_filter.update(gesture_name, confidence)
+                if stable_gesture is not None:
+                    print(f"gesture_name: {stable_gesture}")
+                    self.send_gesture_command(stable_gesture)
 
-            self.annotated_frame, objects_centers, ltrb = yolo_ds_draw(
-                self.latest_frame, self.last_detections, self.class_names
-            )
-            
-            # If user has selected a target, calculate movement and send to Pi
-            if self.tracking_defined and self.frame_count_move_robot >= 8:
-                self.frame_count_move_robot = 0
-
-                # Find the object center based on ID
-                object_center = None
-                for obj in objects_centers:
-                    if obj[0] == str(self.target_id):
-                        object_center = obj
-                        break
-
-                if object_center is not None:
-                    vx, vy, omega = self.tracking_move(object_center, frame, ltrb)
-                    self.send_tracking_command(vx, vy, omega)
-                else:
-                    self.tracking_defined = False
-
-    def process_hand_gesture(self, frame):
-        # Process hand gestures if not tracking an object
-        if not self.tracking_defined:
-            frame = cv2.resize(frame, (960, 540))
-            #frame = cv2.flip(frame, 1)
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            result = self.hand_gesture_service.hands.process(frame)
-            if result.multi_hand_landmarks:
-                for hand_landmarks in result.multi_hand_landmarks:                    
-                    gesture_name = self.hand_gesture_service.process_gesture(hand_landmarks.landmark)
-                    print(f"gesture_name: {gesture_name}")
-                    if("Fire" == gesture_name):
-                        gesture_name = "Up"
-
-                    if self.frame_count_gesture >= 3:
-                        self.frame_count_gesture = 0
-                        self.send_gesture_command(gesture_name)
-
-                    self.hand_gesture_service.draw_landmarks(self.annotated_frame, hand_landmarks)
-
-                    brect = self.hand_gesture_service.calc_bounding_rect(self.annotated_frame, hand_landmarks)
-                    cv2.rectangle(self.annotated_frame, (brect[0], brect[1]), (brect[2], brect[3]), (0, 255, 0), 2)
-                    cv2.putText(
-                        self.annotated_frame, f'Gesture: {gesture_name}', (180, 30),
-                        cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 0, 0), 2, cv2.LINE_AA
-                    )
-            
-            # Calculate and display FPS
-            fps, self.prev_time = self.hand_gesture_service.calculate_fps(self.prev_time, self.prev_fps)
-            self.prev_fps = fps
             cv2.putText(
-                self.annotated_frame, f'FPS: {int(fps)}', (10, 30),
+                self.annotated_frame, f'Gesture: {gesture_name}', (180, 30),
                 cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 0, 0), 2, cv2.LINE_AA
-            )
\ No newline at end of file
+            )
+
+    def draw_fps(self):
+        # Display the FPS calculated in apply_frame
+        cv2.putText(
+            self.annotated_frame, f'FPS: {int(self.prev_fps)}', (10, 30),
+            cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 0, 0), 2, cv2.LINE_AA
+        )
+
+    def calculate_fps(self, prev_time, prev_fps):
+        current_time = time.time()
+        if(current_time - prev_time > 0):
+            fps = 0.9 * prev_fps + 0.1 * (1 / (current_time - prev_time))
+            return fps, current_time
+        else:
+            return 0, current_time
@@ -0,0 +1,102 @@
+import os
+import json
+
+from aws.pubsub_aws_iot import Config, ConnectionManager
+from src.inference_engine import InferenceEngine
+from src.robot_controller import ObjectTrackingRobotController
+from src.web_app import WebApp
+
+# JSON file listing the robots (one KVS stream and one command topic pair each)
+ROBOTS_CONFIG = os.getenv("ROBOTS_CONFIG", "config/robots.json")
+
+
+def load_robot_configs(path=ROBOTS_CONFIG):
+    """
+    Robots served by this process, from a JSON file:
+
+        {"robots": [{"name": "robot1", "stream": "pi-stream-1", "client_id": "pi_sender",
+                     "command_topic": "robot1/command", "tracking_topic": "robot1/command/tracking"}]}
+
+    Only name and stream are required, see with_mqtt_defaults for the MQTT settings.
+    Without the file a single robot is built from the STREAM env var, as before.
+    """
+    if not os.path.exists(path):
+        return [{"name": "robot", "stream": os.getenv("STREAM", "pi-stream-object-detection")}]
+
+    with open(path) as f:
+        robots = json.load(f)["robots"]
+
+    names = set()
+    for robot in robots:
+        if "name" not in robot or "stream" not in robot:
+            raise ValueError(f"Robot config needs a name and a stream: {robot}")
+        if robot["name"] in names:
+            raise ValueError(f"Duplicate robot name in {path}: {robot['name']}")
+        names.add(robot["name"])
+    return robots
+
+
+def with_mqtt_defaults(robot_configs):
+    """
+    Robot configs with client_id, command_topic and tracking_topic filled in. A single robot
+    defaults to the "pi_sender" client and the MQTT_* topic env vars, as before. With several
+    robots the defaults are derived from the robot name ("pi_sender_<name>", "<name>/command",
+    "<name>/command/tracking"), so no Pi executes another robot's commands and no two robots
+    share an MQTT client id. Settings shared by two robots are rejected.
+    """
+    config = Config()
+    single = len(robot_configs) == 1
+    robots = []
+    for robot in robot_configs:
+        name = robot["name"]
+        robots.append(dict({
+            "client_id": "pi_sender" if single else f"pi_sender_{name}",
+            "command_topic": config.command_topic if single else f"{name}/command",
+            "tracking_topic": config.tracking_topic if single else f"{name}/command/tracking",
+        }, **robot))
+
+    for key in ("client_id", "command_topic", "tracking_topic"):
+        seen = {}
+        for robot in robots:
+            if robot[key] in seen:
+                raise ValueError(f"Robots {seen[robot[key]]} and {robot['name']} share {key} {robot[key]}")
+            seen[robot[key]] = robot["name"]
+    return robots
+
+
+class RobotFleet:
+    """
+    All robots of the service process: one ObjectTrackingRobotController per robot (tracker
+    state, gesture filter, command topics) on top of one shared InferenceEngine (models,
+    frame ring, batching) and one WebApp with per-robot routes.
+    """
+
+    def __init__(self, robot_configs, web_port=5000):
+        robot_configs = with_mqtt_defaults(robot_configs)
+        self.robot_configs = {robot["name"]: robot for robot in robot_configs}
+
+        # Start the MQTT connections in the background so the TLS handshakes overlap model loading
+        for robot in robot_configs:
+            ConnectionManager().warm_up(robot["client_id"])
+
+        self.engine = InferenceEngine(num_streams=len(robot_configs))
+        print("Model startup times: " + ", ".join(
+            f"{name}={seconds:.2f}s" for name, seconds in self.engine.startup_times.items()
+        ))
+
+        self.controllers = {}
+        for robot in robot_configs:
+            self.controllers[robot["name"]] = ObjectTrackingRobotController(
+                name=robot["name"],
+                engine=self.engine,
+                client_id=robot["client_id"],
+                command_topic=robot["command_topic"],
+                tracking_topic=robot["tracking_topic"],
+            )
+
+        self.webapp = WebApp(self.controllers, port=web_port)
+        self.webapp.run()
+
+    def streams(self):
+        """(robot name, stream name) pairs"""
+        return [(name, robot["stream"]) for name, robot in self.robot_configs.items()]
@@ -0,0 +1,120 @@
+import os
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+from aws.rolling_stats import RollingWindow, percentile
+
+# Samples kept per stage for the percentiles
+STAGE_TIMING_WINDOW = int(os.getenv("STAGE_TIMING_WINDOW", 1000))
+# Upper bounds (seconds) of the histogram buckets exposed on /metrics
+STAGE_TIMING_BUCKETS = tuple(float(bound) for bound in os.getenv(
+    "STAGE_TIMING_BUCKETS", "0.001,0.0025,0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5").split(","))
+
+# Quantiles of the rolling window exposed on /metrics
+_QUANTILES = (0.5, 0.95, 0.99)
+
+
+class StageTimings:
+    '''
+    Durations of the pipeline stages (fragment, decode, inference, apply, publish...) over a
+    rolling window of samples per stage, with total counts and a cumulative histogram since start
+    (or the last reset). Recording is a lock, a deque append and a bisect, cheap enough per frame.
+    '''
+
+    def __init__(self, window=STAGE_TIMING_WINDOW, buckets=STAGE_TIMING_BUCKETS):
+        self.window = window
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def _get_stage(self, stage):
+        stats = self._stages.get(stage)
+        if stats is None:
+            stats = {"count": 0, "total": 0.0, "samples": RollingWindow(self.window),
+                     "buckets": [0] * len(self.buckets)}
+            self._stages[stage] = stats
+        return stats
+
+    def record(self, stage, seconds):
+        with self._lock:
+            stats = self._get_stage(stage)
+            stats["count"] += 1
+            stats["total"] += seconds
+            stats["samples"].add(seconds)
+            # Per-bucket counts, made cumulative when exported
+            bucket = bisect.bisect_left(self.buckets, seconds)
+            if bucket < len(self.buckets):
+                stats["buckets"][bucket] += 1
+
+    @contextmanager
+    def time(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def count(self, stage):
+        with self._lock:
+            stats = self._stages.get(stage)
+            return stats["count"] if stats else 0
+
+    def summary(self):
+        '''
+        Returns a dict per stage with the count and the p50 / p95 / p99 / max duration (ms)
+        over the rolling window.
+        '''
+        result = {}
+        with self._lock:
+            stages = {stage: (stats["count"], stats["total"], stats["samples"].sorted())
+                      for stage, stats in self._stages.items()}
+        for stage, (count, total, samples) in stages.items():
+            summary = {"count": count, "mean_ms": round(total / count * 1000, 3) if count else 0}
+            if samples:
+                summary.update(p50_ms=round(percentile(samples, 0.50) * 1000, 3),
+                               p95_ms=round(percentile(samples, 0.95) * 1000, 3),
+                               p99_ms=round(percentile(samples, 0.99) * 1000, 3),
+                               max_ms=round(samples[-1] * 1000, 3))
+            result[stage] = summary
+        return result
+
+    def prometheus_text(self, name="pipeline_stage_duration_seconds"):
+        '''
+        Prometheus text exposition: a cumulative histogram per stage, and the p50 / p95 / p99 of the
+        rolling window as a summary (<name>_window) to see what is saturating right now.
+        '''
+        with self._lock:
+            stages = {stage: (stats["count"], stats["total"], list(stats["buckets"]), stats["samples"].sorted())
+                      for stage, stats in self._stages.items()}
+
+        lines = [f"# HELP {name} Duration of each pipeline stage.", f"# TYPE {name} histogram"]
+        for stage, (count, total, buckets, _) in sorted(stages.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, buckets):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{bound:g}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {count}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {total:.6f}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {count}')
+
+        window_name = f"{name}_window"
+        lines += [f"# HELP {window_name} Duration of each pipeline stage over the last {self.window} samples.",
+                  f"# TYPE {window_name} summary"]
+        for stage, (_, _, _, samples) in sorted(stages.items()):
+            if not samples:
+                continue
+            for quantile in _QUANTILES:
+                value = percentile(samples, quantile)
+                lines.append(f'{window_name}{{stage="{stage}",quantile="{quantile:g}"}} {value:.6f}')
+            lines.append(f'{window_name}_sum{{stage="{stage}"}} {sum(samples):.6f}')
+            lines.append(f'{window_name}_count{{stage="{stage}"}} {len(samples)}')
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._stages = {}
+
+
+stage_timings = StageTimings()
@@ -0,0 +1,56 @@
+"""
+Tracking control laws shared by the cloud controller and the Pi edge pipeline.
+Kept free of model and MQTT imports so it loads on the Pi.
+"""
+
+
+def compute_tracking_move(center_x, frame_width, frame_height, ltrb):
+    """
+    Determine how the robot should move based on the object's position in the frame.
+    Returns: (vx, vy, omega, action)
+    """
+    # Define horizontal thresholds (left/center/right)
+    left_threshold = frame_width // 3
+    right_threshold = 2 * frame_width // 3
+
+    # Motion control variables
+    vx = 0       # Left-right movement
+    vy = 0       # Forward-backward movement
+    omega = 0    # Rotation
+
+    frame_area = frame_height * frame_width
+
+    l, t, r, b = ltrb
+    area_bbox = (r - l) * (b - t)
+
+    speed = 0.4
+    if area_bbox < 0.2 * frame_area or b - t <= (0.50*frame_height):
+        vy = speed
+    elif area_bbox > 0.6 * frame_area or b - t >= (0.85*frame_height):
+        vy = -speed
+
+    speed = 0.25
+    # Decide rotation based on horizontal object position
+    if center_x < left_threshold:
+        omega = speed  # Rotate left
+        action = "Turn Left"
+    elif center_x > right_threshold:
+        omega = -speed  # Rotate right
+        action = "Turn Right"
+    else:
+        omega = 0
+        action = "no action"
+
+    return vx, vy, omega, action
+
+
+def compute_tracking_tilt(center_y, frame_height, gain, dead_band):
+    """
+    Camera tilt adjustment (degrees, relative) that keeps the object vertically centred.
+    Returns 0 while the object is inside the vertical dead band.
+    """
+    # -1 (top edge) .. 1 (bottom edge)
+    offset = (center_y - frame_height / 2) / (frame_height / 2)
+    if abs(offset) < dead_band:
+        return 0
+    return round(offset * gain, 1)
@@ -1,10 +1,16 @@
 import requests
 import cv2
-from flask import Flask, Response, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify, abort
 from threading import Thread
+from aws.pubsub_aws_iot import publish_metrics
+from src.stage_timing import stage_timings
 
 class WebApp:
     def __init__(self, robot_controller, pi_ip="http://192.168.2.104:5000", host='0.0.0.0', port=5000):
+        """
+        robot_controller: one controller, or a dict of robot name -> controller. Every robot gets
+        its routes under /robots/<robot_name>/, the root routes serve the first robot.
+        """
         # Initialize Flask app
         self.app = Flask(__name__)
     
@@ -15,7 +21,10 @@ class WebApp:
 
         self.public_ip = None
         
-        self.robot_controller = robot_controller
+        if not isinstance(robot_controller, dict):
+            robot_controller = {robot_controller.name: robot_controller}
+        self.robot_controllers = robot_controller
+        self.robot_controller = next(iter(robot_controller.values()))
         
         # Setup routes
         self._setup_routes()
@@ -26,6 +35,21 @@ class WebApp:
         self.app.route('/video_feed')(self.video_feed)
         self.app.route('/select_object', methods=['POST'])(self.select_object)
         self.app.route('/get_tracking_action', methods=['GET'])(self.get_tracking_action)
+        self.app.route('/publish_metrics', methods=['GET'])(self.get_publish_metrics)
+        self.app.route('/metrics', methods=['GET'])(self.get_metrics)
+        self.app.route('/robots', methods=['GET'])(self.get_robots)
+        self.app.route('/robots/<robot_name>/')(self.index)
+        self.app.route('/robots/<robot_name>/video_feed')(self.video_feed)
+        self.app.route('/robots/<robot_name>/select_object', methods=['POST'])(self.select_object)
+        self.app.route('/robots/<robot_name>/get_tracking_action', methods=['GET'])(self.get_tracking_action)
+
+    def get_controller(self, robot_name=None):
+        """Controller for robot_name (404 if unknown), the first robot when None"""
+        if robot_name is None:
+            return self.robot_controller
+        if robot_name not in self.robot_controllers:
+            abort(404, description=f"Unknown robot: {robot_name}")
+        return self.robot_controllers[robot_name]
     
     def get_ip_address(self):
         try:
@@ -47,18 +71,23 @@ class WebApp:
         except:
             return "localhost"
     
-    def index(self):
+    def index(self, robot_name=None):
+        self.get_controller(robot_name)
         ip_address = self.get_ip_address()
-        return render_template('index_test_yolo_tracking.html', ip_address=ip_address)
+        base_url = f"/robots/{robot_name}" if robot_name is not None else ""
+        return render_template('index_test_yolo_tracking.html', ip_address=ip_address, base_url=base_url)
 
-    def video_feed(self):
+    def video_feed(self, robot_name=None):
         """Route: MJPEG stream for browser"""
+        robot_controller = self.get_controller(robot_name)
+
         def generate():
             while True:
-                with self.robot_controller.frame_lock:
-                    if self.robot_controller.annotated_frame is None:
+                with robot_controller.frame_lock:
+                    if robot_controller.annotated_frame is None:
                         continue
-                    ret, buffer = cv2.imencode('.jpg', self.robot_controller.annotated_frame)
+                    with stage_timings.time("encoding"):
+                        ret, buffer = cv2.imencode('.jpg', robot_controller.annotated_frame)
                     if not ret:
                         continue
                     frame_bytes = buffer.tobytes()
@@ -68,20 +97,50 @@ class WebApp:
 
         return Response(generate(), mimetype='multipart/x-mixed-replace; boundary=frame')
 
-    def select_object(self):
+    def select_object(self, robot_name=None):
         """Route: Receive selected object ID/class from the frontend"""
+        robot_controller = self.get_controller(robot_name)
         data = request.get_json()
-        self.robot_controller.target_id = int(data['id'])  # The ID of the object selected by the user
-        self.robot_controller.target_class_label = data['class_label']
-        self.robot_controller.tracking_defined = True
+        robot_controller.target_id = int(data['id'])  # The ID of the object selected by the user
+        robot_controller.target_class_label = data['class_label']
+        robot_controller.tracking_defined = True
+        robot_controller.send_target_command(robot_controller.target_class_label)
         return jsonify({
             "status": "success",
-            "message": f"Tracking {self.robot_controller.target_class_label} with ID {self.robot_controller.target_id}."
+            "message": f"Tracking {robot_controller.target_class_label} with ID {robot_controller.target_id}."
         })
 
-    def get_tracking_action(self):
+    def get_tracking_action(self, robot_name=None):
         """Route: Used by frontend to poll the current tracking action"""
-        return jsonify({"action": self.robot_controller.tracking_action})
+        return jsonify({"action": self.get_controller(robot_name).tracking_action})
+
+    def get_robots(self):
+        """Route: Robots served by this process and their pages"""
+        return jsonify({
+            name: {"url": f"/robots/{name}/", "tracking_action": robot_controller.tracking_action}
+            for name, robot_controller in self.robot_controllers.items()
+        })
+
+    def get_publish_metrics(self):
+        """Route: MQTT publish counts and publish-ack latency per topic"""
+        return jsonify(publish_metrics.snapshot())
+
+    def get_metrics(self):
+        """Route: per-stage duration histograms and per-robot FPS in Prometheus text format"""
+        lines = [
+            "# HELP robot_fps Smoothed frames per second applied per robot.",
+            "# TYPE robot_fps gauge",
+        ]
+        lines += [f'robot_fps{{robot="{name}"}} {robot_controller.prev_fps:.3f}'
+                  for name, robot_controller in self.robot_controllers.items()]
+        lines += [
+            "# HELP robot_frames_total Frames applied per robot.",
+            "# TYPE robot_frames_total counter",
+        ]
+        lines += [f'robot_frames_total{{robot="{name}"}} {robot_controller.frames_applied}'
+                  for name, robot_controller in self.robot_controllers.items()]
+        body = "\n".join(lines) + "\n" + stage_timings.prometheus_text()
+        return Response(body, mimetype="text/plain; version=0.0.4")
 
     def run(self):
         """Start the Flask app and background processing thread"""
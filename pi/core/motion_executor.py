@@ -0,0 +1,210 @@
+import os
+import threading
+import time
+
+from .motor_control import move_robot, stop
+
+# Default time a command keeps the robot moving, matches the previous move/sleep(0.1)/stop pulse
+DEFAULT_COMMAND_DURATION = float(os.getenv("MOTION_COMMAND_DURATION", 0.1))
+# Control loop rate and ramp limits (speed units per second, speeds are -1..1)
+CONTROL_RATE_HZ = float(os.getenv("MOTION_CONTROL_RATE_HZ", 50))
+MAX_ACCEL = float(os.getenv("MOTION_MAX_ACCEL", 3.0))
+MAX_DECEL = float(os.getenv("MOTION_MAX_DECEL", 6.0))
+# How long (s) to extrapolate the setpoint trend after the last command
+MAX_EXTRAPOLATION = float(os.getenv("MOTION_MAX_EXTRAPOLATION", 0.2))
+
+ZERO = (0.0, 0.0, 0.0)
+
+
+def _clamp(value, low, high):
+    return max(low, min(high, value))
+
+
+def _extrapolate(target, slope, elapsed):
+    """target + slope * elapsed, never crossing zero or changing sign relative to target"""
+    value = target + slope * elapsed
+    if target > 0:
+        return _clamp(value, 0.0, 1.0)
+    if target < 0:
+        return _clamp(value, -1.0, 0.0)
+    return 0.0
+
+
+class MotionExecutor:
+    """
+    Applies velocity commands from a fixed-rate control loop with a deadline watchdog.
+
+    set_velocity() returns immediately: it replaces the current setpoint (or extends its
+    deadline when the velocity is unchanged). The control loop ramps the motor velocity
+    towards the setpoint within the acceleration limits and, when commands carry sender
+    timestamps, briefly extrapolates the setpoint trend between commands (never past zero:
+    a command to stop turning does not turn the other way). When the
+    deadline passes the robot ramps down to a stop; stop_motion() stops at once.
+
+    Commands too short to ramp up to their velocity and back down (discrete gesture pulses)
+    are applied as a step: full velocity at once and a stop at the deadline, so they move
+    as far as the original move/sleep/stop pulses.
+
+    Commands may carry a frame trace (see command_codec). Listeners added with
+    add_actuation_listener(callback) are called as callback(trace, actuation_time) from the
+    control loop right after the tick that applied the command to the motors, with the wall
+    clock time of that tick.
+    """
+
+    def __init__(self, default_duration=DEFAULT_COMMAND_DURATION, control_rate_hz=CONTROL_RATE_HZ,
+                 max_accel=MAX_ACCEL, max_decel=MAX_DECEL, max_extrapolation=MAX_EXTRAPOLATION):
+        self.default_duration = default_duration
+        self.period = 1.0 / control_rate_hz
+        self.max_accel = max_accel
+        self.max_decel = max_decel
+        self.max_extrapolation = max_extrapolation
+
+        self._condition = threading.Condition()
+        self._target = ZERO
+        self._slope = ZERO
+        self._deadline = 0.0
+        self._received_time = 0.0
+        self._last_timestamp = None
+        self._stop_now = False
+        self._step = False
+        self._current = ZERO
+        self._running = False
+        self._thread = None
+        self._pending_trace = None
+        self._actuation_listeners = []
+
+    def start(self):
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name="motion-executor", daemon=True)
+        self._thread.start()
+
+    def shutdown(self, timeout=1.0):
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        stop()
+
+    def add_actuation_listener(self, callback):
+        self._actuation_listeners.append(callback)
+
+    def set_velocity(self, vx, vy, omega, duration=None, timestamp=None, trace=None):
+        """
+        Move with (vx, vy, omega) until now + duration, overriding any current setpoint.
+        The same velocity sent again only pushes the deadline out.
+        timestamp is the sender time of the command, used to estimate the setpoint trend.
+        trace is reported to the actuation listeners once the command reaches the motors.
+        """
+        if not self._running:
+            self.start()
+
+        target = (float(vx), float(vy), float(omega))
+        duration = self.default_duration if duration is None else duration
+        with self._condition:
+            now = time.monotonic()
+            deadline = now + duration
+            active = self._deadline > now
+            if target != self._target or not active:
+                self._step = duration < self._ramp_time(target)
+                self._slope = ZERO
+                if active and timestamp is not None and self._last_timestamp is not None:
+                    dt = timestamp - self._last_timestamp
+                    if 0 < dt <= 1.0:
+                        self._slope = tuple((new - old) / dt for new, old in zip(target, self._target))
+                self._target = target
+                self._deadline = deadline
+            else:
+                self._deadline = max(self._deadline, deadline)
+            self._received_time = now
+            self._last_timestamp = timestamp
+            if trace is not None:
+                self._pending_trace = trace
+            self._condition.notify()
+
+    def stop_motion(self, trace=None):
+        """Stop immediately, without ramping down"""
+        with self._condition:
+            self._target = ZERO
+            self._slope = ZERO
+            self._deadline = 0.0
+            self._stop_now = True
+            self._step = False
+            if trace is not None:
+                self._pending_trace = trace
+            self._condition.notify()
+
+    def _setpoint(self, now):
+        if now >= self._deadline:
+            return ZERO
+        elapsed = min(now - self._received_time, self.max_extrapolation)
+        return tuple(_extrapolate(target, slope, elapsed) for target, slope in zip(self._target, self._slope))
+
+    def _ramp_time(self, target):
+        """Seconds to ramp from standstill up to target and back down to a stop"""
+        speed = max(abs(value) for value in target)
+        return speed / self.max_accel + speed / self.max_decel
+
+    def _ramp(self, current, setpoint):
+        ramped = []
+        for cur, sp in zip(current, setpoint):
+            slowing = abs(sp) < abs(cur) or sp * cur < 0
+            limit = (self.max_decel if slowing else self.max_accel) * self.period
+            value = cur + _clamp(sp - cur, -limit, limit)
+            ramped.append(0.0 if abs(value) < 1e-6 else value)
+        return tuple(ramped)
+
+    def _run(self):
+        next_tick = time.monotonic()
+        while True:
+            with self._condition:
+                # Idle until a command arrives while the robot is stopped
+                while (self._running and not self._stop_now and self._current == ZERO
+                       and self._deadline <= time.monotonic()):
+                    self._condition.wait()
+                    next_tick = time.monotonic()
+
+                if not self._running:
+                    return
+
+                stop_now = self._stop_now
+                self._stop_now = False
+                setpoint = self._setpoint(time.monotonic())
+                step = self._step
+                trace, self._pending_trace = self._pending_trace, None
+
+            # Drive the motors outside the lock so new commands never wait on GPIO
+            if stop_now:
+                self._current = ZERO
+                stop()
+            else:
+                current = setpoint if step else self._ramp(self._current, setpoint)
+                if current != self._current:
+                    self._current = current
+                    if current == ZERO:
+                        stop()
+                    else:
+                        move_robot(*current)
+
+            if trace is not None:
+                actuation_time = time.time()
+                for callback in self._actuation_listeners:
+                    try:
+                        callback(trace, actuation_time)
+                    except Exception as e:
+                        print(f"[WARN] Actuation listener failed: {e}")
+
+            next_tick += self.period
+            sleep_time = next_tick - time.monotonic()
+            if sleep_time > 0:
+                time.sleep(sleep_time)
+            else:
+                next_tick = time.monotonic()
+
+
+# Shared executor for the Pi command handlers (MQTT and TCP)
+motion_executor = MotionExecutor()
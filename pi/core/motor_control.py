@@ -1,3 +1,6 @@
+import os
+import threading
+import time
 from gpiozero import Motor, Servo
 from time import sleep
 
@@ -20,7 +23,7 @@ motor2 = Motor(M2_A, M2_B)
 motor3 = Motor(M3_A, M3_B)
 motor4 = Motor(M4_A, M4_B)
 
-# Setup SG90 servo using gpiozero Servo class
+# SG90 servo is set up lazily by CameraTiltController below
 
 def set_motor_speed(motor, speed):
     """
@@ -127,14 +130,84 @@ def move_diagonal_backward_right(speed):
     set_motor_speed(motor3, 0)
     set_motor_speed(motor4, -speed)
 
+class CameraTiltController:
+    """
+    Keeps one Servo on SERVO_PIN and moves it from a background thread.
+
+    set_angle() returns immediately. Targets that arrive while the servo is still moving
+    are coalesced, only the latest is applied. Once the servo has settled it is detached
+    (optional) so the SG90 stops jittering around its position.
+    """
+
+    def __init__(self, pin=SERVO_PIN, initial_angle=90, settle_time=0.5, detach_after_settle=True,
+                 min_angle=0, max_angle=180):
+        self.pin = pin
+        self.angle = initial_angle
+        self.settle_time = settle_time
+        self.detach_after_settle = detach_after_settle
+        self.min_angle = min_angle
+        self.max_angle = max_angle
+
+        self._servo = None
+        self._target = None
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def set_angle(self, angle):
+        """
+        Move the camera to angle (0-180 degrees) without blocking.
+        """
+        angle = max(self.min_angle, min(self.max_angle, angle))
+        with self._condition:
+            self._target = angle
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="camera-tilt", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def nudge(self, delta):
+        """Move relative to the latest requested angle"""
+        with self._condition:
+            base = self._target if self._target is not None else self.angle
+        self.set_angle(base + delta)
+
+    def _run(self):
+        settle_deadline = None
+        while True:
+            with self._condition:
+                while self._target is None:
+                    timeout = None if settle_deadline is None else settle_deadline - time.monotonic()
+                    if timeout is not None and timeout <= 0:
+                        break
+                    self._condition.wait(timeout)
+                target, self._target = self._target, None
+
+            if target is None:
+                # Settled with no new target
+                settle_deadline = None
+                if self.detach_after_settle:
+                    self._servo.detach()
+                continue
+
+            if self._servo is None:
+                self._servo = Servo(self.pin)
+            elif target == self.angle and settle_deadline is None:
+                continue
+
+            self._servo.value = (target / 180) * 2 - 1  # Map 0-180 degrees to -1 to 1 scale
+            self.angle = target
+            settle_deadline = time.monotonic() + self.settle_time
+
+
+# Shared camera tilt controller, the servo is only set up on first use
+camera_tilt = CameraTiltController(settle_time=float(os.getenv("CAMERA_TILT_SETTLE_TIME", 0.5)))
+
 def control_camera_y_angle(angle):
     """
-    Controls the Y-axis angle of the camera.
-    angle: -1 to 1 (for Servo control)
+    Controls the Y-axis angle of the camera without blocking.
+    angle: 0 to 180 degrees
     """
-    servo = Servo(SERVO_PIN)
-    servo.value = (angle / 180) * 2 - 1  # Map 0-180 degrees to -1 to 1 scale
-    sleep(0.5)  # Delay to let the servo move
+    camera_tilt.set_angle(angle)
 
 def cleanup():
     """ Clean up GPIO pins after the program finishes """
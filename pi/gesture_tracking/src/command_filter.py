@@ -0,0 +1,78 @@
+import os
+import threading
+import time
+
+# Commands older than this (seconds, by sender timestamp) are dropped. <= 0 disables the check.
+# The age is the Pi clock minus the cloud clock, so both must be NTP synced (e.g. systemd-timesyncd
+# or chrony on the Pi): a Pi clock ahead of the cloud by more than this drops every command.
+COMMAND_MAX_AGE = float(os.getenv("COMMAND_MAX_AGE", 1.0))
+# Minimum seconds between two warnings about stale commands (the first one is always logged)
+COMMAND_STALE_LOG_INTERVAL = float(os.getenv("COMMAND_STALE_LOG_INTERVAL", 10.0))
+
+
+class CommandFilter:
+    """
+    Drops duplicated, out-of-order and stale commands using the "seq" and "timestamp"
+    fields stamped by the cloud publisher. Commands without them (older senders, bare
+    TCP gestures) are always accepted.
+
+    A lower sequence number with a newer timestamp means the sender restarted and its
+    counter was reset, so the command is accepted and the sequence tracking restarts.
+    """
+
+    ACCEPTED = "accepted"
+    DUPLICATE = "duplicate"
+    OUT_OF_ORDER = "out_of_order"
+    STALE = "stale"
+
+    def __init__(self, max_age=COMMAND_MAX_AGE, stale_log_interval=COMMAND_STALE_LOG_INTERVAL):
+        self.max_age = max_age
+        self.stale_log_interval = stale_log_interval
+        self._last_stale_log = None
+        self._stale_since_log = 0
+        self._lock = threading.Lock()
+        self._last_seq = None
+        self._last_timestamp = None
+        self.counts = {self.ACCEPTED: 0, self.DUPLICATE: 0, self.OUT_OF_ORDER: 0, self.STALE: 0}
+
+    def check(self, data, now=None):
+        """
+        Classify a decoded command. Returns one of ACCEPTED, DUPLICATE, OUT_OF_ORDER, STALE.
+        """
+        seq = data.get("seq")
+        timestamp = data.get("timestamp")
+        now = time.time() if now is None else now
+
+        stale_log = None
+        with self._lock:
+            result = self.ACCEPTED
+            if timestamp is not None and self.max_age > 0 and now - timestamp > self.max_age:
+                result = self.STALE
+            elif seq is not None and self._last_seq is not None and seq <= self._last_seq:
+                restarted = timestamp is not None and self._last_timestamp is not None and timestamp > self._last_timestamp
+                if not restarted:
+                    result = self.DUPLICATE if seq == self._last_seq else self.OUT_OF_ORDER
+
+            if result == self.ACCEPTED and seq is not None:
+                self._last_seq = seq
+                self._last_timestamp = timestamp
+            self.counts[result] += 1
+            if result == self.STALE:
+                self._stale_since_log += 1
+                if self._last_stale_log is None or now - self._last_stale_log >= self.stale_log_interval:
+                    stale_log = self._stale_since_log
+                    self._last_stale_log = now
+                    self._stale_since_log = 0
+
+        if stale_log is not None:
+            # A steady offset close to the age of every command points at the clocks, not the network
+            print(f"[WARN] Dropped {stale_log} stale command(s), last one {now - timestamp:.3f}s old "
+                  f"(max {self.max_age}s). Check that the Pi and cloud clocks are NTP synced.")
+        return result
+
+    def accept(self, data):
+        return self.check(data) == self.ACCEPTED
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.counts)
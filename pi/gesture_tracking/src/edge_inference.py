@@ -0,0 +1,225 @@
+import os
+import sys
+import threading
+import time
+
+import cv2
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../')))
+
+from cloud_service.src.hand_gesture import HandGestureService, load_tflite_runtime
+from cloud_service.src.gesture_filter import GestureFilter
+from cloud_service.src.tracking_control import compute_tracking_move, compute_tracking_tilt
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from core.motion_executor import motion_executor
+from core.motor_control import camera_tilt
+from gesture_command import process_command
+from latency_stats import LatencyRecorder
+
+MODELS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../cloud_service/models'))
+
+# Camera: device index or a GStreamer pipeline string (e.g. libcamerasrc ... ! appsink)
+EDGE_CAMERA = os.getenv("EDGE_CAMERA", "0")
+EDGE_FRAME_WIDTH = int(os.getenv("EDGE_FRAME_WIDTH", 640))
+EDGE_FRAME_HEIGHT = int(os.getenv("EDGE_FRAME_HEIGHT", 480))
+# Quantized SSD-style TFLite detector (boxes, classes, scores, count outputs) and its label file
+EDGE_DETECTOR_MODEL = os.getenv("EDGE_DETECTOR_MODEL", os.path.join(MODELS_DIR, "detect_int8.tflite"))
+EDGE_DETECTOR_LABELS = os.getenv("EDGE_DETECTOR_LABELS", os.path.join(MODELS_DIR, "coco_labels.txt"))
+EDGE_NUM_THREADS = int(os.getenv("EDGE_NUM_THREADS", 2))
+# Consecutive failed camera reads before the pipeline gives up
+EDGE_MAX_READ_FAILURES = int(os.getenv("EDGE_MAX_READ_FAILURES", 50))
+
+
+class EdgeDetector:
+    """
+    Quantized object detector for on-device tracking. Expects the TFLite detection
+    postprocess output order: boxes (ymin, xmin, ymax, xmax normalized), classes, scores, count.
+    """
+
+    def __init__(self, model_path, labels_path=None, score_threshold=0.5, num_threads=EDGE_NUM_THREADS):
+        Interpreter, _ = load_tflite_runtime()
+        self.interpreter = Interpreter(model_path=model_path, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self.input_details = self.interpreter.get_input_details()
+        self.output_details = self.interpreter.get_output_details()
+        _, self.input_height, self.input_width, _ = self.input_details[0]['shape']
+        self.score_threshold = score_threshold
+
+        self.labels = {}
+        if labels_path and os.path.exists(labels_path):
+            with open(labels_path) as f:
+                self.labels = {i: line.strip() for i, line in enumerate(f) if line.strip()}
+
+    def detect(self, frame_rgb):
+        """
+        Returns a list of (class_label, score, (l, t, r, b)) in frame pixel coordinates.
+        """
+        frame_height, frame_width = frame_rgb.shape[:2]
+        input_data = cv2.resize(frame_rgb, (self.input_width, self.input_height))
+        if self.input_details[0]['dtype'] == np.uint8:
+            input_data = input_data.astype(np.uint8)
+        else:
+            input_data = (input_data.astype(np.float32) - 127.5) / 127.5
+        self.interpreter.set_tensor(self.input_details[0]['index'], input_data[np.newaxis, ...])
+        self.interpreter.invoke()
+
+        boxes = self.interpreter.get_tensor(self.output_details[0]['index'])[0]
+        classes = self.interpreter.get_tensor(self.output_details[1]['index'])[0]
+        scores = self.interpreter.get_tensor(self.output_details[2]['index'])[0]
+
+        detections = []
+        for box, class_id, score in zip(boxes, classes, scores):
+            if score < self.score_threshold:
+                continue
+            ymin, xmin, ymax, xmax = box
+            ltrb = (int(xmin * frame_width), int(ymin * frame_height), int(xmax * frame_width), int(ymax * frame_height))
+            detections.append((self.labels.get(int(class_id), str(int(class_id))), float(score), ltrb))
+        return detections
+
+
+class EdgeInferencePipeline:
+    """
+    On-device control loop: camera -> hand gesture / object detection -> motion executor.
+    Gestures reuse HandGestureService and the TFLite gesture model from cloud_service;
+    tracking uses the quantized EdgeDetector when a model is available. Only the target
+    selection (set_target, e.g. from an LLM lookup in the cloud) comes from outside.
+
+    Capture-to-actuation latency is recorded per commanded frame in self.latency: commands carry
+    a trace with the capture time and the motion executor reports when the motors applied them,
+    the same measurement main.py makes for traced cloud commands.
+    """
+
+    def __init__(self, camera=EDGE_CAMERA, detector_model=EDGE_DETECTOR_MODEL, detector_labels=EDGE_DETECTOR_LABELS,
+                 tracking_duration=0.5, tilt_gain=None, tilt_dead_band=None):
+        self.camera = int(camera) if str(camera).isdigit() else camera
+        self.tracking_duration = tracking_duration
+        self.tilt_gain = float(tilt_gain or os.getenv("CAMERA_TILT_GAIN", 10))
+        self.tilt_dead_band = float(tilt_dead_band or os.getenv("CAMERA_TILT_DEAD_BAND", 0.2))
+
+        self.hand_gesture_service = HandGestureService(model_path=os.path.join(MODELS_DIR, 'hand_gesture_model.tflite'))
+        self.gesture_filter = GestureFilter()
+        self.detector = None
+        if detector_model and os.path.exists(detector_model):
+            self.detector = EdgeDetector(detector_model, detector_labels)
+        else:
+            print(f"[edge] No detector model at {detector_model}, running gesture control only")
+
+        self.target_class_label = None
+        self.latency = LatencyRecorder()
+        motion_executor.add_actuation_listener(self.on_actuation)
+        self.frame_count = 0
+        self._running = False
+        self._thread = None
+
+    def set_target(self, class_label):
+        """Follow the largest detection of class_label (None returns to gesture control)"""
+        self.target_class_label = class_label
+        print(f"[edge] Tracking target: {class_label}")
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self.run, name="edge-inference", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+
+    def run(self, max_frames=None):
+        capture = cv2.VideoCapture(self.camera)
+        capture.set(cv2.CAP_PROP_FRAME_WIDTH, EDGE_FRAME_WIDTH)
+        capture.set(cv2.CAP_PROP_FRAME_HEIGHT, EDGE_FRAME_HEIGHT)
+        self._running = True
+        read_failures = 0
+        try:
+            while self._running and (max_frames is None or self.frame_count < max_frames):
+                ret, frame = capture.read()
+                capture_time = time.time()
+                if not ret:
+                    read_failures += 1
+                    if read_failures >= EDGE_MAX_READ_FAILURES:
+                        raise RuntimeError(f"[edge] Camera {self.camera} failed {read_failures} reads in a row")
+                    print("[edge] Camera read failed")
+                    time.sleep(0.1)
+                    continue
+                read_failures = 0
+                self.frame_count += 1
+                frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                self.process_frame(frame_rgb, self.make_trace(capture_time))
+        finally:
+            capture.release()
+
+    def make_trace(self, capture_time):
+        """Trace of a camera frame, same fields as the cloud commands' traces (see command_codec)"""
+        return {
+            "producer_timestamp": capture_time,
+            "frame_index": self.frame_count,
+            "capture_time": capture_time,
+            "source": "edge",
+        }
+
+    def on_actuation(self, trace, actuation_time):
+        if trace.get("source") == "edge":
+            self.latency.add(actuation_time - trace["capture_time"])
+
+    def process_frame(self, frame_rgb, trace=None):
+        """Run one frame through the local models. Returns True if a command was issued."""
+        if self.target_class_label and self.detector is not None:
+            return self.process_tracking(frame_rgb, trace)
+        return self.process_gesture(frame_rgb, trace)
+
+    def process_tracking(self, frame_rgb, trace=None):
+        frame_height, frame_width = frame_rgb.shape[:2]
+        candidates = [d for d in self.detector.detect(frame_rgb) if d[0] == self.target_class_label]
+        if not candidates:
+            return False
+
+        # Largest box of the target class
+        _, _, ltrb = max(candidates, key=lambda d: (d[2][2] - d[2][0]) * (d[2][3] - d[2][1]))
+        l, t, r, b = ltrb
+        center_x, center_y = (l + r) // 2, (t + b) // 2
+
+        vx, vy, omega, _ = compute_tracking_move(center_x, frame_width, frame_height, ltrb)
+        motion_executor.set_velocity(vx, vy, omega, duration=self.tracking_duration, trace=trace)
+        tilt = compute_tracking_tilt(center_y, frame_height, self.tilt_gain, self.tilt_dead_band)
+        if tilt:
+            camera_tilt.nudge(tilt)
+        return True
+
+    def process_gesture(self, frame_rgb, trace=None):
+        multi_hand_landmarks = self.hand_gesture_service.find_hands(frame_rgb, bgr=False)
+        if not multi_hand_landmarks:
+            self.gesture_filter.update(None)
+            return False
+
+        landmarks = [multi_hand_landmarks[0].landmark]
+        gesture_name, confidence = self.hand_gesture_service.process_gestures_with_confidence(landmarks)[0]
+        if gesture_name == "Fire":
+            gesture_name = "Up"
+
+        # Only stable gestures move the robot
+        stable_gesture = self.gesture_filter.update(gesture_name, confidence)
+        if stable_gesture is None:
+            return False
+        return process_command(stable_gesture, trace)
+
+
+def run_benchmark(pipeline, frames=300):
+    """
+    Run the edge pipeline for a fixed number of frames and return throughput and
+    capture-to-actuation latency, to compare with the capture-to-actuation latency of traced
+    cloud commands logged by main.py.
+    """
+    start = time.monotonic()
+    pipeline.run(max_frames=frames)
+    elapsed = time.monotonic() - start
+    # Let the motion executor apply the last command
+    time.sleep(2 * motion_executor.period)
+    return {
+        "mode": "edge",
+        "frames": pipeline.frame_count,
+        "fps": round(pipeline.frame_count / elapsed, 2) if elapsed > 0 else 0,
+        "capture_to_actuation": pipeline.latency.summary(),
+    }
@@ -1,64 +1,108 @@
 import os
-import socket
 import sys
-from time import sleep
+import json
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../')))
+
+from cloud_service.aws.command_codec import GESTURE_CODES
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
 
-from core.motor_control import move_forward, move_backward, turn_left, turn_right, stop, move_diagonal_forward_left, move_diagonal_forward_right, move_diagonal_backward_left, move_diagonal_backward_right
-
-def process_command(command):
-    print(f"Received Command: {command}")
-    
-    if command == "Up":
-        move_forward(0.3)
-        print("Start Sleep")
-        sleep(0.1)
-        print("Finished Sleep")
-        stop()
-    elif command == "Down":
-        move_backward(0.3)
-        print("Start Sleep")
-        sleep(0.1)
-        print("Finished Sleep")
-        stop()
-    elif command == "Left":
-        turn_left(0.3)
-        print("Start Sleep")
-        sleep(0.1)
-        print("Finished Sleep")
-        stop()
-    elif command == "Right":
-        turn_right(0.3)
-        print("Start Sleep")
-        sleep(0.1)
-        print("Finished Sleep")
-        stop()
-    elif command == "Left Up":
-        move_diagonal_forward_left(0.3)
-        print("Start Sleep")
-        sleep(0.1)
-        print("Finished Sleep")
-        stop()
-    elif command == "Right Up":
-        move_diagonal_forward_right(0.3)
-        print("Start Sleep")
-        sleep(0.1)
-        print("Finished Sleep")
-        stop()
-    elif command == "Left Down":
-        move_diagonal_backward_left(0.3)
-        print("Start Sleep")
-        sleep(0.1)
-        print("Finished Sleep")
-        stop()
-    elif command == "Right Down":
-        move_diagonal_backward_right(0.3)
-        print("Start Sleep")
-        sleep(0.1)
-        print("Finished Sleep")
-        stop()
-    elif command == "Stop":
-        stop()
-    else:
-        print("Invalid Command.")
\ No newline at end of file
+from core.motion_executor import motion_executor
+
+GESTURE_PRIMITIVES_PATH = os.getenv(
+    "GESTURE_PRIMITIVES_PATH",
+    os.path.abspath(os.path.join(os.path.dirname(__file__), '../config/gesture_primitives.json'))
+)
+
+# Fallback when no config file is found: (vx, vy, omega, duration). The diagonal
+# velocities reproduce the per-motor speeds of the move_diagonal_* functions at speed 0.3.
+DEFAULT_PRIMITIVES = {
+    "Up": (0.0, 0.3, 0.0, 0.1),
+    "Down": (0.0, -0.3, 0.0, 0.1),
+    "Left": (0.0, 0.0, 0.3, 0.1),
+    "Right": (0.0, 0.0, -0.3, 0.1),
+    "Left Up": (0.15, 0.15, 0.0, 0.1),
+    "Right Up": (-0.15, 0.15, 0.0, 0.1),
+    "Left Down": (-0.15, -0.15, 0.0, 0.1),
+    "Right Down": (0.15, -0.15, 0.0, 0.1),
+    "Stop": (0.0, 0.0, 0.0, 0.0),
+}
+
+def load_primitives(path=GESTURE_PRIMITIVES_PATH):
+    """
+    Load gesture motion primitives from a JSON file of
+    {"<gesture>": {"vx": .., "vy": .., "omega": .., "duration": ..}}.
+    Returns DEFAULT_PRIMITIVES if the file does not exist.
+    """
+    if not path or not os.path.exists(path):
+        return dict(DEFAULT_PRIMITIVES)
+
+    with open(path) as f:
+        config = json.load(f)
+
+    return {
+        name: (float(p.get("vx", 0)), float(p.get("vy", 0)), float(p.get("omega", 0)), float(p.get("duration", 0)))
+        for name, p in config.items()
+    }
+
+class GestureDispatcher:
+    """
+    Table-driven gesture dispatch. Gesture names and command_codec gesture codes map to
+    (vx, vy, omega, duration) primitives applied through the motion executor.
+    An all-zero primitive stops the robot immediately.
+    Logging is off by default and rate-limited to one line per log_interval seconds.
+    """
+
+    def __init__(self, primitives=None, executor=motion_executor, verbose=False, log_interval=1.0):
+        self.executor = executor
+        self.verbose = verbose
+        self.log_interval = log_interval
+        self._last_log_time = 0.0
+        self.set_primitives(primitives if primitives is not None else load_primitives())
+
+    def set_primitives(self, primitives):
+        table = dict(primitives)
+        for name, primitive in primitives.items():
+            if name in GESTURE_CODES:
+                table[GESTURE_CODES[name]] = primitive
+        self.table = table
+
+    def log(self, message):
+        if not self.verbose:
+            return
+        now = time.monotonic()
+        if now - self._last_log_time >= self.log_interval:
+            self._last_log_time = now
+            print(message)
+
+    def dispatch(self, command, trace=None):
+        primitive = self.table.get(command)
+        if primitive is None:
+            self.log(f"Invalid Command: {command}")
+            return False
+
+        vx, vy, omega, duration = primitive
+        if vx == 0 and vy == 0 and omega == 0:
+            self.executor.stop_motion(trace=trace)
+        else:
+            self.executor.set_velocity(vx, vy, omega, duration=duration, trace=trace)
+        self.log(f"Received Command: {command}")
+        return True
+
+dispatcher = GestureDispatcher(
+    verbose=os.getenv("GESTURE_LOG", "0") == "1",
+    log_interval=float(os.getenv("GESTURE_LOG_INTERVAL", 1.0)),
+)
+
+def stop(trace=None):
+    motion_executor.stop_motion(trace=trace)
+
+def process_command(command, trace=None):
+    """
+    Start the motion for a gesture (name or code) and return immediately.
+    The motion executor stops the motors when the primitive's duration expires.
+    trace is the frame trace of the command, logged when the motors are actuated.
+    """
+    return dispatcher.dispatch(command, trace)
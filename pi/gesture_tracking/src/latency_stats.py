@@ -0,0 +1,37 @@
+import os
+import sys
+import threading
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../')))
+
+from cloud_service.aws.rolling_stats import RollingWindow, percentile
+
+
+class LatencyRecorder:
+    """Rolling window of latency samples (seconds) with percentile summaries in ms"""
+
+    def __init__(self, window=1000):
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples = RollingWindow(window)
+        self.count = 0
+
+    def add(self, latency):
+        with self._lock:
+            self.count += 1
+            self._samples.add(latency)
+
+    def summary(self):
+        with self._lock:
+            samples = self._samples.sorted()
+            count = self.count
+        if not samples:
+            return {"count": count}
+
+        return {
+            "count": count,
+            "p50_ms": round(percentile(samples, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(samples, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(samples, 0.99) * 1000, 2),
+            "max_ms": round(samples[-1] * 1000, 2),
+        }
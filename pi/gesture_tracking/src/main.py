@@ -2,80 +2,179 @@ import sys
 import os
 import time
 from gesture_command import process_command, stop
-from tcp_connection import wait_for_client_connection, receive_command
+from tcp_connection import CommandServer
+from command_filter import CommandFilter
+from latency_stats import LatencyRecorder
 import argparse
 import json
-import time
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../')))
 
-from cloud_service.aws.pubsub_aws_iot import subscribe
+from cloud_service.aws.pubsub_aws_iot import subscribe, Config
+from cloud_service.aws.command_codec import decode_command, is_binary_payload, format_trace_id
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
 
-from core.motor_control import move_robot
+from core.motion_executor import motion_executor
+from core.motor_control import camera_tilt
+
+command_filter = CommandFilter()
+cloud_latency = LatencyRecorder()
+# Frame capture to command receipt / motor actuation, both on the Pi's clock (the Pi produces the video)
+capture_to_receipt = LatencyRecorder()
+capture_to_actuation = LatencyRecorder()
+
+# Log every traced command on receipt and actuation
+FRAME_TRACE_LOG = os.getenv("FRAME_TRACE_LOG", "1") == "1"
+
+# Set when running with --edge Y
+edge_pipeline = None
+
+# Seconds between command filter stats printouts
+STATS_INTERVAL = float(os.getenv("COMMAND_STATS_INTERVAL", 60))
+
+# Name of this robot in the cloud fleet (robots.json). With several robots every Pi needs its own
+# MQTT client id, or AWS IoT disconnects the previous connection that used it.
+ROBOT_NAME = os.getenv("ROBOT_NAME", "")
+MQTT_CLIENT_ID = os.getenv("MQTT_CLIENT_ID") or (f"pi_robot_{ROBOT_NAME}" if ROBOT_NAME else "pi_robot")
+
+# Tracking setpoints arrive at most every few hundred ms, hold each one until the next
+TRACKING_COMMAND_DURATION = float(os.getenv("MOTION_TRACKING_DURATION", 0.5))
 
 def main():
     parser = argparse.ArgumentParser()
 
     parser.add_argument("--cloud", default="Y")
+    parser.add_argument("--edge", default="N", help="Y to run gesture/detection models on the Pi")
+    parser.add_argument("--benchmark", type=int, default=0,
+                        help="Run the edge pipeline for this many frames, print latency stats and exit")
     args = parser.parse_args()
 
+    motion_executor.add_actuation_listener(log_trace_actuated)
+    motion_executor.start()
+
+    if args.edge == 'Y' or args.benchmark:
+        start_edge_pipeline(args.benchmark)
+        if args.benchmark:
+            return
+
     if args.cloud == 'Y':
         aws_connection()
     else:
         socket_connection()
 
+def start_edge_pipeline(benchmark_frames=0):
+    global edge_pipeline
+    from edge_inference import EdgeInferencePipeline, run_benchmark
+
+    edge_pipeline = EdgeInferencePipeline(tracking_duration=TRACKING_COMMAND_DURATION)
+    if benchmark_frames:
+        print(json.dumps(run_benchmark(edge_pipeline, benchmark_frames)))
+    else:
+        edge_pipeline.start()
+
 def socket_connection():
-    client_socket = None  # Initialize client_socket to ensure it's defined before use
-    command = None
-    
-    try:
-        while True:
-            try:
-                # Only try to get a connection if the client_socket is not initialized
-                if client_socket is None or command is None:
-                    client_socket, _ = wait_for_client_connection()
-                    if client_socket is None:
-                        continue  # Skip the rest of the loop if connection fails
-
-                command = receive_command(client_socket)
-                if command is not None:
-                    process_command(command)
-            except Exception as e:
-                print(f"Error processing command: {e}")
-                
-    finally:
-        if client_socket:  # Ensure client_socket is only closed if it was opened
-            client_socket.close()
+    server = CommandServer(on_command=process_socket_command)
+    server.serve_forever()
+
+def process_socket_command(payload):
+    # Framed TCP payloads are either full commands (JSON / binary) or a bare gesture name
+    if is_binary_payload(payload) or payload.lstrip().startswith(b"{"):
+        process_command_json(payload)
+    else:
+        process_command(payload.decode().strip())
 
 def aws_connection():
-    mqtt_connection = subscribe(client_id="pi_robot", callback=process_command_json)
+    config = Config()
+    mqtt_connection = subscribe(client_id=MQTT_CLIENT_ID, callback=process_command_json,
+                                message_topic=[config.command_topic, config.tracking_topic])
+    last_stats_time = time.monotonic()
     while(True):
         time.sleep(0.1)
+        if time.monotonic() - last_stats_time >= STATS_INTERVAL:
+            last_stats_time = time.monotonic()
+            print(f"Command stats: {command_filter.get_stats()} cloud latency: {cloud_latency.summary()}")
+            print(f"Capture to receipt: {capture_to_receipt.summary()} "
+                  f"capture to actuation: {capture_to_actuation.summary()}")
+
+# Traces from older cloud builds may lack fields, the stages they cannot time are skipped
+def log_trace_received(command, trace, receipt_time):
+    capture_time = trace.get("capture_time")
+    if capture_time is None:
+        return
+    latency = receipt_time - capture_time
+    capture_to_receipt.add(latency)
+    if FRAME_TRACE_LOG:
+        print(f"[trace] {format_trace_id(trace)} received {command} capture_to_receipt_ms={latency * 1000:.1f}")
+
+def log_trace_actuated(trace, actuation_time):
+    if trace.get("source") == "edge":
+        # Local edge commands are measured by the edge pipeline
+        return
+    capture_time = trace.get("capture_time")
+    if capture_time is None:
+        return
+    latency = actuation_time - capture_time
+    capture_to_actuation.add(latency)
+    if FRAME_TRACE_LOG:
+        print(f"[trace] {format_trace_id(trace)} actuated capture_to_actuation_ms={latency * 1000:.1f}")
 
 def process_command_json(data_str):
     try:
-        data = json.loads(data_str)  # convert JSON string to Python dict
+        receipt_time = time.time()
+        data = decode_command(data_str)  # JSON string or binary payload to Python dict
+        if not isinstance(data, dict):
+            raise ValueError(f"expected a JSON object, got {type(data).__name__}")
         command = data.get("command")
+        trace = data.get("trace")
+        if not isinstance(trace, dict):
+            trace = None
+
+        # Drop duplicated, out-of-order and stale commands (e.g. replayed after a reconnect)
+        result = command_filter.check(data)
+        if result != CommandFilter.ACCEPTED:
+            return
 
-        if command == "tracking":
+        # Sender-to-Pi latency of the cloud path (assumes NTP-synced clocks)
+        if data.get("timestamp") is not None:
+            cloud_latency.add(receipt_time - data["timestamp"])
+
+        if edge_pipeline is not None and command in ("tracking", "gesture"):
+            # In edge mode the Pi's own models drive the motors, the cloud only selects targets
+            pass
+
+        elif command == "tracking":
             vx = data.get("vx", 0)
             vy = data.get("vy", 0)
             omega = data.get("omega", 0)
-            move_robot(vx, vy, omega)
-            time.sleep(0.1)
-            stop()
+            # Returns immediately, the executor ramps to the setpoint and stops when it expires
+            motion_executor.set_velocity(vx, vy, omega, duration=TRACKING_COMMAND_DURATION,
+                                         timestamp=data.get("timestamp"), trace=trace)
+            tilt = data.get("tilt", 0)
+            if tilt:
+                camera_tilt.nudge(tilt)
 
         elif command == "gesture":
             gesture = data.get("gesture", "unknown")
-            process_command(gesture)
+            process_command(gesture, trace)
+
+        elif command == "stop":
+            stop(trace)
+
+        elif command == "target":
+            # Target selection from the cloud (web UI / LLM lookup) for the edge pipeline
+            if edge_pipeline is not None:
+                edge_pipeline.set_target(data.get("class_label"))
 
         else:
             print(f"[ERROR] Unknown command: {command}")
 
-    except json.JSONDecodeError as e:
-        print(f"[ERROR] Invalid JSON: {e}")
+        # Logged once the command is dispatched, so tracing never delays or drops it
+        if trace is not None:
+            log_trace_received(command, trace, receipt_time)
+
+    except ValueError as e:
+        print(f"[ERROR] Invalid command payload: {e}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,47 +1,132 @@
+import selectors
 import socket
+import struct
 
-def wait_for_client_connection():
-    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    try:
-        server_socket.bind(('0.0.0.0', 12000))
-        server_socket.listen(1)
-        print("Waiting for a connection...")
+# Every message is framed as a 4 byte big-endian length followed by the payload,
+# so commands arriving in one TCP segment (or split across several) are delivered intact.
+FRAME_HEADER = struct.Struct("!I")
+MAX_FRAME_SIZE = 64 * 1024
 
-        client_socket, addr = server_socket.accept()
-        print(f"Connected to {addr}")
-        return client_socket, addr
 
-    except socket.error as e:
-        print(f"Socket error: {e}")
-        return None, None
+def encode_frame(payload):
+    if isinstance(payload, str):
+        payload = payload.encode()
+    return FRAME_HEADER.pack(len(payload)) + bytes(payload)
 
-    except Exception as e:
-        print(f"Unexpected error: {e}")
-        return None, None
 
-    finally:
-        server_socket.close()
+def send_command(client_socket, payload):
+    """Send one framed command (str or bytes) on a connected socket"""
+    client_socket.sendall(encode_frame(payload))
 
-def receive_command(client_socket):
-    try:
-        data = client_socket.recv(1024)
-        if not data:
-            print("Client disconnected.")
-            return None
-        return data.decode().strip()
 
-    except ConnectionResetError:
-        print("Connection reset by peer.")
-        return None
+class FrameDecoder:
+    """Accumulates received bytes and yields complete frame payloads"""
+
+    def __init__(self, max_frame_size=MAX_FRAME_SIZE):
+        self.max_frame_size = max_frame_size
+        self._buffer = bytearray()
+
+    def feed(self, data):
+        self._buffer.extend(data)
+        frames = []
+        while len(self._buffer) >= FRAME_HEADER.size:
+            (length,) = FRAME_HEADER.unpack_from(self._buffer)
+            if length > self.max_frame_size:
+                raise ValueError(f"Frame too large: {length} bytes")
+            end = FRAME_HEADER.size + length
+            if len(self._buffer) < end:
+                break
+            frames.append(bytes(self._buffer[FRAME_HEADER.size:end]))
+            del self._buffer[:end]
+        return frames
+
+
+class CommandServer:
+    """
+    Persistent TCP command listener. One listening socket serves any number of
+    clients through a selector loop; each complete frame is passed to on_command(payload).
+    """
+
+    def __init__(self, on_command, host='0.0.0.0', port=12000):
+        self.on_command = on_command
+        self.host = host
+        self.port = port
+        self.selector = selectors.DefaultSelector()
+        self.server_socket = None
+        self._running = False
+
+    def start(self):
+        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server_socket.bind((self.host, self.port))
+        self.server_socket.listen()
+        self.server_socket.setblocking(False)
+        self.selector.register(self.server_socket, selectors.EVENT_READ, data=None)
+        print(f"Waiting for connections on {self.host}:{self.port}...")
 
-    except socket.timeout:
-        print("Socket timed out while waiting for data.")
-        return None
+    def serve_forever(self, poll_interval=0.5):
+        if self.server_socket is None:
+            self.start()
+        self._running = True
+        try:
+            while self._running:
+                for key, _ in self.selector.select(timeout=poll_interval):
+                    if key.data is None:
+                        self._accept()
+                    else:
+                        self._read(key)
+        finally:
+            self.close()
+
+    def shutdown(self):
+        self._running = False
+
+    def close(self):
+        for key in list(self.selector.get_map().values()):
+            self.selector.unregister(key.fileobj)
+            key.fileobj.close()
+        self.selector.close()
+        self.server_socket = None
+
+    def _accept(self):
+        try:
+            client_socket, addr = self.server_socket.accept()
+        except socket.error as e:
+            print(f"Socket error: {e}")
+            return
+        print(f"Connected to {addr}")
+        client_socket.setblocking(False)
+        client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.selector.register(client_socket, selectors.EVENT_READ, data=(addr, FrameDecoder()))
+
+    def _disconnect(self, client_socket, addr, reason):
+        print(f"Client {addr} disconnected: {reason}")
+        self.selector.unregister(client_socket)
+        client_socket.close()
+
+    def _read(self, key):
+        client_socket = key.fileobj
+        addr, decoder = key.data
+        try:
+            data = client_socket.recv(4096)
+        except (BlockingIOError, InterruptedError):
+            return
+        except socket.error as e:
+            self._disconnect(client_socket, addr, e)
+            return
+
+        if not data:
+            self._disconnect(client_socket, addr, "connection closed")
+            return
 
-    except socket.error as e:
-        print(f"Socket error: {e}")
-        return None
+        try:
+            frames = decoder.feed(data)
+        except ValueError as e:
+            self._disconnect(client_socket, addr, e)
+            return
 
-    except Exception as e:
-        print(f"Unexpected error: {e}")
-        return None
+        for payload in frames:
+            try:
+                self.on_command(payload)
+            except Exception as e:
+                print(f"Error processing command: {e}")